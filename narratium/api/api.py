@@ -1,21 +1,42 @@
 import asyncio
 import json
 import os
-from typing import AsyncGenerator, List, Optional
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Dict, List, Optional
 
-import uvicorn
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
-from narratium.core.game import TextAdventureGame
-from narratium.utils.parser import parse_character, parse_event, parse_story
+from narratium.core.cache import response_cache
+from narratium.core.game import TextAdventureGame, speculation_stats, speculative_max_k
+from narratium.core.llm import registry
+from narratium.core.scheduler import scheduler
+from narratium.core.sessions import SessionBusy, SessionManager, SessionNotFound
+from narratium.core.tracing import RequestTimingMiddleware, stat_lines, tracer
+from narratium.models.history import History
+from narratium.utils.tokens import warm_encoding
+
+batch_concurrency = int(os.getenv("NARRATIUM_BATCH_CONCURRENCY", "16"))
+
+# imports the SDKs named in NARRATIUM_PRELOAD_PROVIDERS now; other providers load with their first session
+registry.preload()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(warm_encoding)
+    yield
+    # compressions and roll-ups are event-loop tasks; flush them before the loop cancels whatever is left
+    await sessions.close_all()
+
 
 app = FastAPI(
     title="Narratium Text Adventure API",
     description="API for interacting with the Narratium Text Adventure Game",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -25,8 +46,49 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if tracer.enabled:
+    app.add_middleware(RequestTimingMiddleware)
+
+
+def history_path(game_id: str):
+    return f"history_{game_id}.json"
+
+
+def create_game(
+    game_id: str, model: Optional[str] = None, language: str = "en", type: str = "openai", speculative: int = 0
+):
+    game = TextAdventureGame(model=model, file_path=history_path(game_id), auto_test=False, language=language)
+    game.initialize_game(language, type=type)
+    game.speculative_k = max(0, min(speculative, speculative_max_k))
+    config = dict(model=model, language=language, type=type, speculative=speculative)
+    if game.history.session_config != config:
+        # written with the game's first save, so abandoned sessions leave no history behind
+        game.history.set_session_config(config)
+    return game
+
+
+def load_session_config(game_id: str):
+    history = History("en", history_path(game_id))
+    if not history.exists() or not history.load_history():
+        return None
+    # histories written before configs were stored resume with the defaults
+    return history.session_config or {}
 
-game_instances = {}
+
+sessions = SessionManager(create_game, load_config=load_session_config)
+
+
+async def get_game(game_id: str):
+    game = await sessions.get(game_id)
+    if game is None:
+        raise HTTPException(status_code=404, detail="Game instance not found")
+    return game
+
+
+def check_busy(game_id: str):
+    # streams can only answer 409 before the response starts
+    if sessions.turn_policy == "reject" and sessions.busy(game_id):
+        raise HTTPException(status_code=409, detail="Another turn is in progress for this game")
 
 
 class GameInitRequest(BaseModel):
@@ -34,6 +96,8 @@ class GameInitRequest(BaseModel):
     file_path: Optional[str] = None
     language: str = "en"
     type: str = "openai"
+    # premium sessions: pre-generate turns for this many suggested prompts
+    speculative: int = 0
 
 
 class ActionRequest(BaseModel):
@@ -41,6 +105,11 @@ class ActionRequest(BaseModel):
     user_input: str
 
 
+class BatchActionRequest(BaseModel):
+    actions: List[ActionRequest]
+    concurrency: Optional[int] = None
+
+
 class NewGameRequest(BaseModel):
     game_id: str
     story_framework: str
@@ -53,6 +122,52 @@ class GameResponse(BaseModel):
     next_prompts: List[str]
     success: bool
     message: Optional[str] = None
+    context_usage: Optional[Dict[str, int]] = None
+
+
+async def setup_stream_lines(game: TextAdventureGame, request: NewGameRequest) -> AsyncGenerator[str, None]:
+    try:
+        yield json.dumps({"type": "start", "game_id": request.game_id}) + "\n"
+
+        game.history.add_story("story_framework", story=request.story_framework)
+        yield json.dumps({"type": "progress", "step": "story_framework_added"}) + "\n"
+
+        await game.acreate_character(request.character_info)
+        yield json.dumps({"type": "progress", "step": "character_created"}) + "\n"
+
+        async for event in game.astream_story(request.story_framework):
+            if event.kind == "delta":
+                yield json.dumps({"type": "chunk", "content": event.content}) + "\n"
+            elif event.kind == "complete":
+                result = event.content
+
+        yield json.dumps({"type": "complete", "next_prompts": result["next_prompts"], "success": True}) + "\n"
+
+    except Exception as e:
+        yield json.dumps({"type": "error", "message": str(e), "success": False}) + "\n"
+
+
+async def action_stream_lines(game: TextAdventureGame, request: ActionRequest) -> AsyncGenerator[str, None]:
+    try:
+        yield json.dumps({"type": "start", "game_id": request.game_id}) + "\n"
+
+        async for event in game.astream_action(request.user_input):
+            if event.kind == "delta":
+                yield json.dumps({"type": "chunk", "content": event.content}) + "\n"
+            elif event.kind == "complete":
+                result = event.content
+
+        yield json.dumps(
+            {
+                "type": "complete",
+                "next_prompts": result["next_prompts"],
+                "context_usage": result["context_usage"],
+                "success": True,
+            }
+        ) + "\n"
+
+    except Exception as e:
+        yield json.dumps({"type": "error", "message": str(e), "success": False}) + "\n"
 
 
 @app.post("/initialize", response_model=GameResponse)
@@ -60,11 +175,12 @@ async def initialize_game(request: GameInitRequest):
     game_id = os.urandom(8).hex()
 
     try:
-        game = TextAdventureGame(
-            model=request.model, file_path=f"history_{game_id}.json", auto_test=False, language=request.language
+        config = dict(
+            model=request.model, language=request.language, type=request.type, speculative=request.speculative
         )
-        game.initialize_game(request.language, type=request.type)
-        game_instances[game_id] = game
+        # building a game can load the embedder or a provider SDK, kept off the event loop
+        game = await asyncio.to_thread(create_game, game_id, **config)
+        sessions.add(game_id, game, **config)
 
         return GameResponse(
             game_id=game_id,
@@ -78,36 +194,19 @@ async def initialize_game(request: GameInitRequest):
 
 @app.post("/setup", response_model=GameResponse)
 async def setup_new_game(request: NewGameRequest):
-    if request.game_id not in game_instances:
-        raise HTTPException(status_code=404, detail="Game instance not found")
-
-    game = game_instances[request.game_id]
+    await get_game(request.game_id)
 
     try:
-        game.history.add_story("story_framework", story=request.story_framework)
-        character_output = game.character_chain.invoke(request.character_info)
-        character_info = parse_character(character_output)
-        game.character.set_info(character_info)
-        story_output = game.story_chain.invoke(
-            {
-                "story_framework": request.story_framework,
-                "character_info": game.character.__str__(language=game.language),
-            }
-        )
-        result = parse_story(story_output)
-
-        game.history.add_story(type="recent", story=result["narrative"], user_input="")
-
-        compressed_result = game.compression_chain.invoke({"user_input": "", "story": result["narrative"]})
-        event = parse_event(compressed_result)
-        game.history.add_story(type="history", story=event, user_input="")
-
-        game.initialized = True
-        game.history.save_history()
+        async with sessions.game_turn(request.game_id) as game:
+            result = await game.asetup_new_game(request.story_framework, request.character_info)
 
         return GameResponse(
             game_id=request.game_id, narrative=result["narrative"], next_prompts=result["next_prompts"], success=True
         )
+    except SessionBusy:
+        raise HTTPException(status_code=409, detail="Another turn is in progress for this game")
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Game instance not found")
     except Exception as e:
         return GameResponse(
             game_id=request.game_id,
@@ -118,12 +217,8 @@ async def setup_new_game(request: NewGameRequest):
         )
 
 
-@app.post("/action", response_model=GameResponse)
-async def take_action(request: ActionRequest):
-    if request.game_id not in game_instances:
-        raise HTTPException(status_code=404, detail="Game instance not found")
-
-    game = game_instances[request.game_id]
+async def run_action(request: ActionRequest) -> GameResponse:
+    game = await get_game(request.game_id)
 
     if not game.initialized:
         return GameResponse(
@@ -135,11 +230,21 @@ async def take_action(request: ActionRequest):
         )
 
     try:
-        result = game.take_action(request.user_input)
+        result = await sessions.run_turn(
+            request.game_id, request.user_input, lambda game: game.atake_action(request.user_input)
+        )
 
         return GameResponse(
-            game_id=request.game_id, narrative=result["narrative"], next_prompts=result["next_prompts"], success=True
+            game_id=request.game_id,
+            narrative=result["narrative"],
+            next_prompts=result["next_prompts"],
+            success=True,
+            context_usage=result.get("context_usage"),
         )
+    except SessionBusy:
+        raise HTTPException(status_code=409, detail="Another turn is in progress for this game")
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Game instance not found")
     except Exception as e:
         return GameResponse(
             game_id=request.game_id,
@@ -150,89 +255,164 @@ async def take_action(request: ActionRequest):
         )
 
 
-@app.post("/setup/stream")
-async def setup_new_game_stream(request: NewGameRequest):
-    if request.game_id not in game_instances:
-        raise HTTPException(status_code=404, detail="Game instance not found")
-
-    game = game_instances[request.game_id]
-
-    async def generate_setup_stream() -> AsyncGenerator[str, None]:
-        try:
-            yield json.dumps({"type": "start", "game_id": request.game_id}) + "\n"
-
-            game.history.add_story("story_framework", story=request.story_framework)
-            yield json.dumps({"type": "progress", "step": "story_framework_added"}) + "\n"
-
-            character_output = await asyncio.to_thread(game.character_chain.invoke, request.character_info)
-            character_info = parse_character(character_output)
-            game.character.set_info(character_info)
-            yield json.dumps({"type": "progress", "step": "character_created"}) + "\n"
-
-            story_params = {
-                "story_framework": request.story_framework,
-                "character_info": game.character.__str__(language=game.language),
-            }
+async def batch_stream_lines(request: BatchActionRequest) -> AsyncGenerator[str, None]:
+    concurrency = max(1, min(request.concurrency or batch_concurrency, batch_concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+    results = asyncio.Queue()
+
+    # actions for the same game run one after another in request order; different games run side by side
+    games = {}
+    for index, action in enumerate(request.actions):
+        games.setdefault(action.game_id, []).append((index, action))
+
+    stopped = asyncio.Event()
+
+    async def run_game_actions(actions):
+        for index, action in actions:
+            async with semaphore:
+                if stopped.is_set():
+                    return
+                try:
+                    response = await run_action(action)
+                except Exception as e:
+                    message = e.detail if isinstance(e, HTTPException) else str(e)
+                    response = GameResponse(
+                        game_id=action.game_id,
+                        narrative=f"Error processing action: {message}",
+                        next_prompts=[],
+                        success=False,
+                        message=message,
+                    )
+            await results.put((index, response))
+
+    # referenced until the batch is done so the running tasks are not garbage collected
+    tasks = [asyncio.create_task(run_game_actions(actions)) for actions in games.values()]
+    try:
+        yield json.dumps({"type": "start", "count": len(request.actions), "concurrency": concurrency}) + "\n"
+        succeeded = 0
+        for _ in request.actions:
+            index, response = await results.get()
+            succeeded += response.success
+            yield json.dumps({"type": "result", "index": index, **response.model_dump()}) + "\n"
+        yield json.dumps(
+            {"type": "complete", "count": len(request.actions), "succeeded": succeeded, "success": True}
+        ) + "\n"
+    finally:
+        # if the client goes away, turns already running finish and are saved; queued ones are dropped
+        stopped.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-            story_output = await asyncio.to_thread(game.story_chain.invoke, story_params)
-            result = parse_story(story_output)
 
-            narrative = result["narrative"]
-            chunk_size = 10
-            for i in range(0, len(narrative), chunk_size):
-                chunk = narrative[i : i + chunk_size]
-                yield json.dumps({"type": "chunk", "content": chunk}) + "\n"
-                await asyncio.sleep(0.1)
+@app.post("/action", response_model=GameResponse)
+async def take_action(request: ActionRequest):
+    return await run_action(request)
 
-            game.history.add_story(type="recent", story=result["narrative"], user_input="")
 
-            compressed_result = await asyncio.to_thread(
-                game.compression_chain.invoke, {"user_input": "", "story": result["narrative"]}
-            )
-            event = parse_event(compressed_result)
-            game.history.add_story(type="history", story=event, user_input="")
+@app.post("/action/batch")
+async def take_action_batch(request: BatchActionRequest):
+    return StreamingResponse(batch_stream_lines(request), media_type="application/x-ndjson")
 
-            game.initialized = True
-            game.history.save_history()
 
-            yield json.dumps({"type": "complete", "next_prompts": result["next_prompts"], "success": True}) + "\n"
+@app.post("/setup/stream")
+async def setup_new_game_stream(request: NewGameRequest):
+    await get_game(request.game_id)
+    check_busy(request.game_id)
 
-        except Exception as e:
-            yield json.dumps({"type": "error", "message": str(e), "success": False}) + "\n"
+    async def generate_setup_stream() -> AsyncGenerator[str, None]:
+        try:
+            async with sessions.game_turn(request.game_id) as current:
+                async for line in setup_stream_lines(current, request):
+                    yield line
+        except SessionBusy:
+            yield json.dumps({"type": "error", "message": "Another turn is in progress", "success": False}) + "\n"
+        except SessionNotFound:
+            yield json.dumps({"type": "error", "message": "Game instance not found", "success": False}) + "\n"
 
     return StreamingResponse(generate_setup_stream(), media_type="application/x-ndjson")
 
 
 @app.post("/action/stream")
 async def take_action_stream(request: ActionRequest):
-    if request.game_id not in game_instances:
-        raise HTTPException(status_code=404, detail="Game instance not found")
-
-    game = game_instances[request.game_id]
+    game = await get_game(request.game_id)
 
     if not game.initialized:
         raise HTTPException(status_code=400, detail="Game not initialized")
+    check_busy(request.game_id)
 
     async def generate_stream() -> AsyncGenerator[str, None]:
         try:
-            yield json.dumps({"type": "start", "game_id": request.game_id}) + "\n"
-            result = await asyncio.to_thread(game.take_action, request.user_input)
-
-            narrative = result["narrative"]
-            chunk_size = 10
-            for i in range(0, len(narrative), chunk_size):
-                chunk = narrative[i : i + chunk_size]
-                yield json.dumps({"type": "chunk", "content": chunk}) + "\n"
-                await asyncio.sleep(0.1)
+            # the response starts before the turn is held, so the game is fetched again under the turn
+            async with sessions.game_turn(request.game_id) as current:
+                async for line in action_stream_lines(current, request):
+                    yield line
+        except SessionBusy:
+            yield json.dumps({"type": "error", "message": "Another turn is in progress", "success": False}) + "\n"
+        except SessionNotFound:
+            yield json.dumps({"type": "error", "message": "Game instance not found", "success": False}) + "\n"
 
-            yield json.dumps({"type": "complete", "next_prompts": result["next_prompts"], "success": True}) + "\n"
-
-            game.history.save_history()
+    return StreamingResponse(generate_stream(), media_type="application/x-ndjson")
 
-        except Exception as e:
-            yield json.dumps({"type": "error", "message": str(e), "success": False}) + "\n"
 
-    return StreamingResponse(generate_stream(), media_type="application/x-ndjson")
+@app.get("/sessions/stats")
+async def session_stats():
+    return {**sessions.stats(), "speculation": speculation_stats}
+
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    return scheduler.stats()
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats() if response_cache is not None else {"enabled": False}
+
+
+@app.get("/traces")
+async def recent_traces(limit: int = 20, min_duration: float = 0.0, stage: Optional[str] = None):
+    # newest first; e.g. /traces?stage=turn&min_duration=5 for the slow turns
+    return {"enabled": tracer.enabled, "traces": tracer.recent(limit, min_duration, stage)}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    lines = tracer.render()
+    session_stats = sessions.stats()
+    lines += stat_lines("narratium_sessions_live", "Live game sessions", [({}, session_stats["live"])])
+    lines += stat_lines(
+        "narratium_sessions_memory_bytes", "Estimated memory of live sessions", [({}, session_stats["memory_bytes"])]
+    )
+    lines += stat_lines("narratium_turns_active", "Turns currently running", [({}, session_stats["active_turns"])])
+    provider_stats = scheduler.stats()
+    lines += stat_lines(
+        "narratium_llm_active",
+        "LLM calls holding a scheduler slot",
+        [({"provider": provider}, stats["active"]) for provider, stats in provider_stats.items()],
+    )
+    lines += stat_lines(
+        "narratium_llm_queue_depth",
+        "LLM calls waiting for a scheduler slot",
+        [
+            ({"provider": provider, "priority": priority}, depth)
+            for provider, stats in provider_stats.items()
+            for priority, depth in stats["queue_depth"].items()
+        ],
+    )
+    if response_cache is not None:
+        cache = response_cache.stats()
+        lines += stat_lines(
+            "narratium_response_cache_lookups_total",
+            "Response cache lookups",
+            [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])],
+            "counter",
+        )
+    lines += stat_lines(
+        "narratium_speculation_turns_total",
+        "Speculative turns by outcome",
+        [({"outcome": outcome}, count) for outcome, count in speculation_stats.items()],
+        "counter",
+    )
+    return "\n".join(lines) + "\n"
 
 
 @app.get("/")
@@ -245,4 +425,6 @@ async def root():
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("narratium.api.api:app", host="0.0.0.0", port=8000, reload=True)
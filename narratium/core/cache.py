@@ -0,0 +1,135 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, Generation
+
+response_cache_enabled = os.getenv("NARRATIUM_RESPONSE_CACHE", "on") != "off"
+response_cache_size = int(os.getenv("NARRATIUM_RESPONSE_CACHE_SIZE", "1024"))
+response_cache_ttl = float(os.getenv("NARRATIUM_RESPONSE_CACHE_TTL", "86400"))
+response_cache_db = os.getenv("NARRATIUM_RESPONSE_CACHE_DB", "")
+
+# only model outputs are ever written to the disk tier
+CACHED_TYPES = [Generation, ChatGeneration, ChatGenerationChunk, AIMessage, AIMessageChunk]
+
+RESPONSE_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS response_cache (
+    key VARCHAR PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+
+class ResponseCache(BaseCache):
+    # langchain passes the serialized messages as prompt and the model name plus sampling params as llm_string
+    def __init__(
+        self,
+        max_entries: int = response_cache_size,
+        ttl: float = response_cache_ttl,
+        path: str = response_cache_db,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.connection = None
+        if path:
+            try:
+                self.connection = sqlite3.connect(path, check_same_thread=False)
+                self.connection.execute("PRAGMA journal_mode=WAL")
+                self.connection.execute(RESPONSE_CACHE_SCHEMA)
+                self.connection.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+                self.connection.commit()
+            except Exception as e:
+                print(f"Error opening response cache {path}: {str(e)}")
+                self.connection = None
+
+    def key(self, prompt: str, llm_string: str):
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = self.key(prompt, llm_string)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, generations = entry
+                if expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return generations
+                del self.entries[key]
+                self.expired += 1
+
+            if self.connection is not None:
+                row = self.connection.execute(
+                    "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if row[1] > now:
+                        generations = loads(row[0], allowed_objects=CACHED_TYPES)
+                        self.put(key, row[1], generations)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return generations
+                    self.connection.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                    self.connection.commit()
+                    self.expired += 1
+
+            self.misses += 1
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        key = self.key(prompt, llm_string)
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            self.put(key, expires_at, return_val)
+            if self.connection is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, dumps(return_val), expires_at),
+                )
+                self.connection.commit()
+
+    def put(self, key: str, expires_at: float, generations):
+        self.entries[key] = (expires_at, generations)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+
+    def clear(self, **kwargs):
+        with self.lock:
+            self.entries.clear()
+            if self.connection is not None:
+                self.connection.execute("DELETE FROM response_cache")
+                self.connection.commit()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disk": self.connection is not None,
+            }
+
+
+response_cache = ResponseCache() if response_cache_enabled else None
@@ -0,0 +1,233 @@
+import os
+import re
+
+from narratium.models.event_index import EventIndex, retrieval_k, top_k
+from narratium.models.history import History
+from narratium.utils.tokens import count_tokens, exact_counts
+
+context_budget = int(os.getenv("NARRATIUM_CONTEXT_BUDGET", "6000"))
+rollup_fanout = int(os.getenv("NARRATIUM_ROLLUP_FANOUT", "4"))
+
+SENTENCE_END = re.compile(r"[。！？.!?]")
+
+
+def lead_sentence(text: str) -> str:
+    for line in text.splitlines():
+        line = line.strip().lstrip("-*• ").strip()
+        if line:
+            match = SENTENCE_END.search(line)
+            return line[: match.end()] if match else line
+    return ""
+
+
+def extractive_rollup(events: list[str], budget: int, fanout: int = rollup_fanout) -> str:
+    # level 1 keeps the lead sentence of every event; each further level keeps one lead per group of fanout
+    leads = [lead for lead in (lead_sentence(event) for event in events) if lead]
+    while leads:
+        text = "".join(f"- {lead}\n" for lead in leads) + "\n"
+        if count_tokens(text) <= budget:
+            return text
+        if len(leads) == 1:
+            break
+        leads = leads[::fanout]
+    return ""
+
+
+def shared_prefix_len(a: bytes, b: bytes) -> int:
+    # binary search on slice equality, which compares in C without copying
+    a, b = memoryview(a), memoryview(b)
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class ContextBuilder:
+    def __init__(
+        self,
+        budget: int = context_budget,
+        fanout: int = rollup_fanout,
+        k: int = retrieval_k,
+        layout: str = "default",
+    ):
+        self.budget = budget
+        self.fanout = fanout
+        self.k = k
+        self.layout = layout
+        # stable layout: the history section is only appended to until it outgrows the budget and is rebuilt
+        self.anchor = ""
+        self.anchor_end = 0
+        self.anchor_raw_start = 0
+        self.anchor_usage = None
+        self.anchor_exact = False
+
+    def build(self, history: History, character_info: str, user_input: str, index: EventIndex | None = None):
+        # the query is embedded before taking the history lock so background compressions are not held up
+        scores = index.score(user_input) if index is not None and self.k > 0 else None
+        with history.lock:
+            story_framework = history.get_story("story_framework")
+            usage, remaining = self.fixed_usage(story_framework, character_info, user_input)
+            recent = history.recent_story
+            window_start, recent_start, recent_tokens = self.recent_window(history, remaining)
+            remaining -= recent_tokens
+
+            events_end = min(len(history.history_story.story), recent_start)
+            if self.layout == "stable":
+                history_story, recalled_story, history_usage = self.stable_history_section(
+                    history, events_end, remaining, scores
+                )
+            else:
+                head, recalled_story, tail, history_usage = self.history_section(history, events_end, remaining, scores)
+                history_story = head + tail
+
+            if recent_start == window_start:
+                recent_story = history.get_story("recent")
+            else:
+                recent_story = recent.get_story(recent_start, len(recent.story))
+
+        usage["recent_story"] = recent_tokens
+        usage.update(history_usage)
+        usage["recent_turns"] = len(recent.story) - recent_start
+        usage["total"] = (
+            usage["story_framework"]
+            + usage["character_info"]
+            + usage["user_input"]
+            + recent_tokens
+            + usage["history_story"]
+            + usage["history_summaries"]
+            + usage["recalled_story"]
+            + usage["history_rollup"]
+        )
+
+        inputs = {
+            "story_framework": story_framework,
+            "character_info": character_info,
+            "history_story": history_story,
+            # recalled events have their own section after the history, so they are not taken for the latest turns
+            "recalled_story": recalled_story,
+            "recent_story": recent_story,
+            "user_input": user_input,
+        }
+        return inputs, usage
+
+    def fixed_usage(self, story_framework: str, character_info: str, user_input: str):
+        usage = {
+            "budget": self.budget,
+            "story_framework": count_tokens(story_framework),
+            "character_info": count_tokens(character_info),
+            "user_input": count_tokens(user_input),
+        }
+        return usage, self.budget - usage["story_framework"] - usage["character_info"] - usage["user_input"]
+
+    def recent_window(self, history: History, remaining: int):
+        # recent turns, newest first, within the mem_len window; the last turn is kept even when it is over budget
+        recent = history.recent_story
+        window_start = max(0, len(recent.story) - history.mem_len)
+        recent_start = len(recent.story)
+        recent_tokens = 0
+        while recent_start > window_start:
+            tokens = recent.entry_tokens(recent_start - 1)
+            if recent_tokens + tokens > remaining and recent_start < len(recent.story):
+                break
+            recent_tokens += tokens
+            recent_start -= 1
+        return window_start, recent_start, recent_tokens
+
+    def events_needed(self, history: History, character_info: str, user_input: str):
+        # the history section reads the compressed events before the first recent turn that fits the budget
+        with history.lock:
+            _, remaining = self.fixed_usage(history.get_story("story_framework"), character_info, user_input)
+            _, recent_start, _ = self.recent_window(history, remaining)
+        return recent_start
+
+    def history_section(self, history: History, events_end: int, remaining: int, scores=None):
+        # summary nodes for the settled part of the timeline, then compressed events for the turns not covered
+        # by the recent section; both are taken newest first and whatever is left over is rolled up
+        events = history.history_story
+        nodes, covered = history.summary_cover(events_end)
+        span = [(history.summaries[level - 1], index, index * history.summary_fanout**level) for level, index in nodes]
+        span += [(events, index, index) for index in range(covered, events_end)]
+
+        start = len(span)
+        history_tokens = 0
+        summary_tokens = 0
+        while start > 0:
+            story, index, _ = span[start - 1]
+            tokens = story.entry_tokens(index)
+            if history_tokens + summary_tokens + tokens > remaining:
+                break
+            if story is events:
+                history_tokens += tokens
+            else:
+                summary_tokens += tokens
+            start -= 1
+        remaining -= history_tokens + summary_tokens
+
+        # events only present through a summary or the roll-up can be recalled by similarity to the input
+        raw_start = next((first for story, _, first in span[start:] if story is events), events_end)
+        recalled, recalled_tokens = self.recall(events, scores, raw_start, remaining)
+        remaining -= recalled_tokens
+
+        rolled_up = [story.story[index] for story, index, _ in span[:start]]
+        rollup = extractive_rollup(rolled_up, remaining, self.fanout) if rolled_up else ""
+
+        summary_story = "".join(story.entry(index) for story, index, _ in span[start:] if story is not events)
+        recalled_story = "".join(events.entry(event) for event in recalled)
+        event_story = "".join(story.entry(index) for story, index, _ in span[start:] if story is events)
+
+        usage = {
+            "history_story": history_tokens,
+            "history_summaries": summary_tokens,
+            "recalled_story": recalled_tokens,
+            "history_rollup": count_tokens(rollup),
+            "history_events": sum(1 for story, _, _ in span[start:] if story is events),
+            "summary_nodes": sum(1 for story, _, _ in span[start:] if story is not events),
+            "recalled_events": len(recalled),
+            "rolled_up_events": span[start][2] if start < len(span) else events_end,
+        }
+        return rollup + summary_story, recalled_story, event_story, usage
+
+    def stable_history_section(self, history: History, events_end: int, remaining: int, scores=None):
+        events = history.history_story
+        usage = self.anchor_usage
+        appended = False
+        # an anchor counted with estimates is rebuilt once the tokenizer has loaded
+        if usage is not None and self.anchor_end <= events_end and self.anchor_exact == exact_counts():
+            tail_tokens = sum(events.entry_tokens(index) for index in range(self.anchor_end, events_end))
+            if usage["history_story"] + usage["history_summaries"] + usage["history_rollup"] + tail_tokens <= remaining:
+                self.anchor += events.get_story(self.anchor_end, events_end)
+                usage["history_story"] += tail_tokens
+                usage["history_events"] += events_end - self.anchor_end
+                self.anchor_end = events_end
+                appended = True
+
+        if not appended:
+            # rebuilt with half the room so the following turns can append before the next rebuild
+            head, _, tail, usage = self.history_section(history, events_end, remaining // 2)
+            self.anchor = head + tail
+            self.anchor_end = events_end
+            # verbatim events form the tail of the anchor; only older ones can be recalled
+            self.anchor_raw_start = events_end - usage["history_events"]
+            self.anchor_usage = usage
+            self.anchor_exact = exact_counts()
+
+        remaining -= usage["history_story"] + usage["history_summaries"] + usage["history_rollup"]
+        recalled, recalled_tokens = self.recall(events, scores, self.anchor_raw_start, remaining)
+        usage = dict(usage, recalled_story=recalled_tokens, recalled_events=len(recalled))
+        return self.anchor, "".join(events.entry(event) for event in recalled), usage
+
+    def recall(self, events, scores, limit: int, remaining: int):
+        recalled = []
+        recalled_tokens = 0
+        if scores is not None:
+            for event in top_k(scores, limit, self.k):
+                tokens = events.entry_tokens(event)
+                if recalled_tokens + tokens <= remaining:
+                    recalled.append(event)
+                    recalled_tokens += tokens
+            recalled.sort()
+        return recalled, recalled_tokens
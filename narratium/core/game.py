@@ -1,25 +1,39 @@
+import asyncio
 import os
 import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
 from dotenv import load_dotenv
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
 
+from narratium.core.context import ContextBuilder, shared_prefix_len
+from narratium.core.llm import prompt_layout, registry
+from narratium.core.retry import RetryPolicy
+from narratium.core.scheduler import BACKGROUND, INTERACTIVE, PRIORITY_NAMES, SETUP, SPECULATIVE, scheduler
+from narratium.core.tracing import tracer
 from narratium.models.character import Character
+from narratium.models.event_index import EventIndex, get_embedder, retrieval_k
 from narratium.models.history import History
 from narratium.prompts.system_content import SystemContents
 from narratium.prompts.system_prompts import SystemPrompts
-from narratium.utils.parser import parse_character, parse_event, parse_story
+from narratium.utils.parser import STORY_TAGS, ParseEvent, StreamParser, parse_character, parse_event, parse_story
+from narratium.utils.tokens import count_tokens
 
 load_dotenv()
 model = os.getenv("QWQ_MODEL")
-url = os.getenv("QWQ_URL")
-api_key = os.getenv("QWQ_API_KEY")
-ollama_model = os.getenv("OLLAMA_MODEL")
-ollama_url = os.getenv("OLLAMA_URL")
+compression_workers = int(os.getenv("NARRATIUM_COMPRESSION_WORKERS", "4"))
+# operators opt in to premium speculation; each speculated prompt costs a full turn of upstream tokens
+speculative_max_k = int(os.getenv("NARRATIUM_SPECULATIVE_MAX_K", "0"))
+# auto_test answers the setup questions itself and stops after this many turns (0 plays forever)
+auto_test_framework = os.getenv(
+    "NARRATIUM_AUTO_TEST_FRAMEWORK", "A quiet river town where people have started disappearing at night."
+)
+auto_test_character = os.getenv("NARRATIUM_AUTO_TEST_CHARACTER", "A young locksmith looking for a missing sister.")
+auto_test_turns = int(os.getenv("NARRATIUM_AUTO_TEST_TURNS", "0"))
+
+compression_pool = ThreadPoolExecutor(max_workers=compression_workers, thread_name_prefix="compression")
+
+speculation_stats = {"started": 0, "hits": 0, "misses": 0, "discarded": 0}
 
 
 class TextAdventureGame:
@@ -39,12 +53,32 @@ class TextAdventureGame:
         self.system_contents = None
         self.initialized = False
         self.auto_test = auto_test
+        # only the terminal game asks before retrying; server games never read stdin
+        self.interactive = False
+        self.retry_policy = RetryPolicy()
+        # number of suggested prompts whose turns are generated ahead of time, 0 disables speculation
+        self.speculative_k = 0
+        self.speculating = None
+        self.speculations = {}
+        # set once an evicted or shut-down session is closed; no new background LLM work starts after that
+        self.closed = False
+        self.speculation_seq = None
         self.action_history = None
+        self.llm_type = None
         self.llm = None
         self.character_chain = None
         self.story_chain = None
         self.action_chain = None
         self.compression_chain = None
+        self.rollup_chain = None
+        self.pending_compression = None
+        self.pending_rollup = None
+        self.action_prompt = None
+        self.last_prompt = b""
+        self.last_prompt_hash = None
+        self.context_builder = ContextBuilder(layout=prompt_layout)
+        self.event_index = None
+        self.context_usage = None
 
     def initialize_game(self, language: str, type: str = "openai"):
         self.language = language
@@ -54,123 +88,165 @@ class TextAdventureGame:
         self.system_contents = SystemContents(language=language)
         self.setup_llm(type)
         self.setup_chains()
+        self.setup_event_index()
 
         if self.auto_test:
             self.action_history = []
 
     def setup_llm(self, type: str = "openai"):
-        try:
-            if type == "openai":
-                self.llm = ChatOpenAI(
-                    model=self.model,
-                    api_key=api_key,
-                    base_url=url,
-                    temperature=0.9,
-                    max_tokens=2000,
-                    streaming=True,
-                )
-            elif type == "ollama":
-                self.llm = ChatOllama(
-                    model=self.model,
-                    base_url=ollama_url,
-                    temperature=0.9,
-                    max_tokens=2000,
-                    streaming=True,
-                )
-            else:
-                raise ValueError(f"Unknown LLM type: {type}")
-        except Exception as e:
-            print(f"Error setting up LLM: {str(e)}")
-            try:
-                self.llm = ChatOllama(
-                    model=ollama_model,
-                    base_url=ollama_url,
-                    temperature=0.9,
-                    max_tokens=2000,
-                    streaming=True,  # 启用流式输出
-                )
-            except Exception as e:
-                print(f"Error setting up Ollama LLM: {str(e)}")
-                raise RuntimeError("Failed to initialize any LLM")
+        self.llm_type = type
+        self.llm = registry.get_llm(type, self.model)
 
     def setup_chains(self):
-        character_prompt = ChatPromptTemplate.from_messages(
-            ("human", self.system_prompts.get_character_easy_prompt("{character_info}")),
-        )
-        self.character_chain = (
-            {"character_info": RunnablePassthrough()} | character_prompt | self.llm | StrOutputParser()
-        )
-
-        system_prompt = self.system_prompts.get_text_adventure_prompt()
-        story_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", system_prompt),
-                ("human", self.system_prompts.get_setting_prompt("{story_framework}", "{character_info}")),
-            ]
-        )
-        self.story_chain = (
-            {"story_framework": lambda x: x["story_framework"], "character_info": lambda x: x["character_info"]}
-            | story_prompt
-            | self.llm
-            | StrOutputParser()
-        )
-
-        action_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", system_prompt),
-                (
-                    "human",
-                    self.system_prompts.get_embedded_story_prompt(
-                        "{story_framework}", "{character_info}", "{history_story}", "{recent_story}", "{user_input}"
-                    ),
-                ),
-            ]
-        )
-        self.action_chain = (
-            {
-                "story_framework": lambda x: x["story_framework"],
-                "character_info": lambda x: x["character_info"],
-                "history_story": lambda x: x["history_story"],
-                "recent_story": lambda x: x["recent_story"],
-                "user_input": lambda x: x["user_input"],
-            }
-            | action_prompt
-            | self.llm
-            | StrOutputParser()
-        )
-
-        compression_prompt = ChatPromptTemplate.from_messages(
-            ("human", self.system_prompts.get_story_compressor_prompt("{user_input}", "{story}"))
-        )
-        self.compression_chain = (
-            {"user_input": lambda x: x["user_input"], "story": lambda x: x["story"]}
-            | compression_prompt
-            | self.llm
-            | StrOutputParser()
-        )
-
-    def start_game(self):
+        chains = registry.get_chains(self.llm_type, self.model, self.language)
+        self.character_chain = chains.character_chain
+        self.story_chain = chains.story_chain
+        self.action_chain = chains.action_chain
+        self.action_prompt = chains.action_prompt
+        self.compression_chain = chains.compression_chain
+        self.rollup_chain = chains.rollup_chain
+
+    def setup_event_index(self):
+        if retrieval_k <= 0:
+            return
+        embedder = get_embedder()
+        if embedder is not None:
+            self.event_index = EventIndex(self.file_path, embedder)
+            # events loaded from disk that were never embedded are caught up off the turn path
+            compression_pool.submit(self.index_events)
+
+    def index_events(self):
+        try:
+            with tracer.span("index_events"):
+                self.event_index.sync(self.history.history_story.story)
+        except Exception as e:
+            print(f"Error indexing events: {str(e)}")
+
+    def resolve_chain(self, name: str):
+        # while the primary provider is degraded, calls go to the Ollama fallback
+        fallback = registry.fallback(self.llm_type, self.model)
+        if fallback is not None and registry.is_degraded(self.llm_type, self.model):
+            return fallback[0], fallback[1], getattr(registry.get_chains(*fallback, self.language), name)
+        return self.llm_type, self.model, getattr(self, name)
+
+    def record_call_error(self, type: str, model: str, e: Exception):
+        if self.retry_policy.is_retryable(e):
+            registry.record_failure(type, model)
+
+    def invoke_chain(self, name: str, inputs, priority: int):
+        with tracer.span(name, priority=PRIORITY_NAMES[priority]) as span:
+
+            def call():
+                type, model, chain = self.resolve_chain(name)
+                queued = time.perf_counter()
+                with scheduler.slot(type, priority):
+                    span.set("provider", type)
+                    span.add("queue_wait", time.perf_counter() - queued)
+                    span.add("attempts", 1)
+                    try:
+                        output = chain.invoke(inputs)
+                    except Exception as e:
+                        self.record_call_error(type, model, e)
+                        raise
+                registry.record_success(type, model)
+                return output
+
+            output = self.retry_policy.call(call)
+            if span:
+                span.set("tokens", count_tokens(output))
+            return output
+
+    async def ainvoke_chain(self, name: str, inputs, priority: int):
+        with tracer.span(name, priority=PRIORITY_NAMES[priority]) as span:
+
+            async def call():
+                type, model, chain = self.resolve_chain(name)
+                queued = time.perf_counter()
+                async with scheduler.aslot(type, priority):
+                    span.set("provider", type)
+                    span.add("queue_wait", time.perf_counter() - queued)
+                    span.add("attempts", 1)
+                    try:
+                        output = await chain.ainvoke(inputs)
+                    except Exception as e:
+                        self.record_call_error(type, model, e)
+                        raise
+                registry.record_success(type, model)
+                return output
+
+            output = await self.retry_policy.acall(call)
+            if span:
+                span.set("tokens", count_tokens(output))
+            return output
+
+    async def astream_chain(self, name: str, inputs, priority: int):
+        # the slot is held until the stream is drained; a stream is only retried before its first chunk
+        # the span is not made current, as the caller runs between the chunks
+        span = tracer.span(name, priority=PRIORITY_NAMES[priority])
+        chunks = []
+        error = None
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                type, model, chain = self.resolve_chain(name)
+                started = False
+                try:
+                    queued = time.perf_counter()
+                    async with scheduler.aslot(type, priority):
+                        granted = time.perf_counter()
+                        span.set("provider", type)
+                        span.add("queue_wait", granted - queued)
+                        span.add("attempts", 1)
+                        async for chunk in chain.astream(inputs):
+                            if not started:
+                                span.set("first_chunk", time.perf_counter() - granted)
+                                started = True
+                            if span:
+                                chunks.append(chunk)
+                            yield chunk
+                    registry.record_success(type, model)
+                    return
+                except Exception as e:
+                    self.record_call_error(type, model, e)
+                    if started or not self.retry_policy.should_retry(e, attempt):
+                        raise
+                    await asyncio.sleep(self.retry_policy.retrying(e, attempt))
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if span:
+                span.set("tokens", count_tokens("".join(chunks)))
+            span.close(error)
+
+    def start_game(self, type: str = "openai"):
         print("=" * 50)
         print("INFINITE TEXT ADVENTURE / 无限文本冒险")
         print("=" * 50)
         print("\nSelect language / 选择语言 1 or 2:\n")
         print("1. English")
         print("2. 中文\n")
-        while True:
+        while not self.auto_test:
             lang_choice = input("> ").strip()
             if lang_choice in ["1", "2"]:
-                language = "en" if lang_choice == "1" else "zh"
-                self.language = language
+                self.language = "en" if lang_choice == "1" else "zh"
                 break
             print("Invalid choice. Please enter 1 or 2 / 无效选择。请输入 1 或 2")
 
-        self.initialize_game(language)
+        self.initialize_game(self.language, type=type)
+        self.interactive = not self.auto_test
 
         if self.initialized:
             print(self.system_contents.get_continue_adventure_message())
             print(self.history.get_story("recent"))
         else:
-            initialization_success, result = self.setup_new_game()
+            with tracer.span("setup", mode="cli"):
+                initialization_success, result = self.setup_new_game()
+
+            if not initialization_success:
+                print(self.system_contents.get_game_setup_failed_message())
+                return
 
             print("\n" + "-" * 50)
             print(result["narrative"])
@@ -181,15 +257,16 @@ class TextAdventureGame:
                 self.action_history = result["next_prompts"]
             print("-" * 50)
 
-            if not initialization_success:
-                print(self.system_contents.get_game_setup_failed_message())
-                return
-
         self.game_loop()
 
     def game_loop(self):
+        turns = 0
         while True:
             print(self.system_contents.get_action_message())
+            if self.auto_test and auto_test_turns and turns >= auto_test_turns:
+                print(self.system_contents.get_quit_message())
+                break
+            turns += 1
             if self.auto_test:
                 user_input = random.choice(self.action_history)
                 print(f"\nauto test: {user_input}")
@@ -211,111 +288,404 @@ class TextAdventureGame:
                 self.action_history = result["next_prompts"]
             print("-" * 50)
 
-    def setup_new_game(self, retry_count=0, max_retries=3):
+    def setup_new_game(self):
         print(self.system_contents.get_start_message())
         print(self.system_contents.get_setting_message())
-        story_framework = input("\n> ")
+        story_framework = self.read_input(auto_test_framework)
         self.history.add_story("story_framework", story=story_framework)
         print(self.system_contents.get_character_message())
 
-        character_info = input("\n> ")
+        character_info = self.read_input(auto_test_character)
 
         try:
-            character_output = self.character_chain.invoke(character_info)
+            character_output = self.invoke_chain("character_chain", character_info, SETUP)
             character_info = parse_character(character_output)
             self.character.set_info(character_info)
+            self.history.set_character(character_info)
         except Exception as e:
             print(f"Error generating character: {str(e)}")
             return False, str(e)
 
         print(self.system_contents.get_general_adventure_message())
 
-        try:
-            story_output = self.story_chain.invoke(
-                {"story_framework": story_framework, "character_info": self.character.__str__(language=self.language)}
-            )
-
-            result = parse_story(story_output)
-
-            self.history.add_story(type="recent", story=result["narrative"], user_input="")
-
-            compressed_result = self.compression_chain.invoke({"user_input": "", "story": result["narrative"]})
-
-            event = parse_event(compressed_result)
-            self.history.add_story(type="history", story=event, user_input="")
-            self.initialized = True
-            self.history.save_history()
-
-            return True, result
+        while True:
+            try:
+                story_output = self.invoke_chain("story_chain", self.build_story_inputs(story_framework), SETUP)
 
-        except Exception as e:
-            print(f"Error generating adventure world: {str(e)}")
+                result = parse_story(story_output)
+                self.record_action("", result)
+                self.initialized = True
 
-            if retry_count >= max_retries:
-                print(self.system_contents.get_maximum_retry_attempts_reached_message())
-                return False, str(e)
+                return True, result
 
-            print(self.system_contents.get_retry_initialization_message())
-            retry = input("\n> ").lower()
+            except Exception as e:
+                # transient errors were already retried with backoff by the retry policy
+                print(f"Error generating adventure world: {str(e)}")
 
-            if retry == "y" or retry == "yes":
+                if not self.confirm_retry(self.system_contents.get_retry_initialization_message()):
+                    print(self.system_contents.get_game_initialization_aborted_message())
+                    return False, str(e)
                 print(self.system_contents.get_retrying_initialization_message())
-                return self.setup_new_game(retry_count + 1, max_retries)
-            else:
-                print(self.system_contents.get_game_initialization_aborted_message())
-                return False, ""
 
     def take_action(self, user_input):
         if not self.initialized:
             print(self.system_contents.get_game_not_initialized_message())
             return {"narrative": self.system_contents.get_game_not_initialized_message(), "next_prompts": []}
 
+        while True:
+            try:
+                with tracer.span("turn", mode="cli"):
+                    action_output = self.invoke_chain("action_chain", self.get_action_inputs(user_input), INTERACTIVE)
+
+                    with tracer.span("parse"):
+                        result = parse_story(action_output)
+                    result["context_usage"] = self.context_usage
+                    self.record_action(user_input, result)
+
+                return result
+
+            except Exception as e:
+                error_message = f"Error processing action: {str(e)}"
+                print(error_message)
+
+                if not self.confirm_retry(self.system_contents.get_retry_action_message()):
+                    return {
+                        "narrative": self.system_contents.get_failed_to_process_action_message(),
+                        "next_prompts": ["Try a different action", "Restart the game"],
+                    }
+                print(self.system_contents.get_retrying_action_message())
+
+    def read_input(self, auto_answer: str):
+        if self.auto_test:
+            print(f"\nauto test: {auto_answer}")
+            return auto_answer
+        return input("\n> ")
+
+    def confirm_retry(self, message: str):
+        if not self.interactive:
+            return False
+        print(message)
+        retry = input("\n> ").lower()
+        return retry == "y" or retry == "yes"
+
+    def get_action_inputs(self, user_input: str):
+        if self.needs_compressed_history(user_input):
+            with tracer.span("compression_wait"):
+                self.wait_for_compression()
+        return self.build_action_inputs(user_input)
+
+    async def aget_action_inputs(self, user_input: str):
+        if self.needs_compressed_history(user_input):
+            with tracer.span("compression_wait"):
+                await self.await_compression()
+        if self.event_index is not None:
+            # embedding the input is model work, kept off the event loop
+            return await asyncio.to_thread(self.build_action_inputs, user_input)
+        return self.build_action_inputs(user_input)
+
+    def needs_compressed_history(self, user_input: str):
+        # only events older than the recent turns are rendered, so a pending compression is usually not needed yet
+        if self.pending_compression is None or self.pending_compression.done():
+            return False
+        character_info = self.character.__str__(language=self.language)
+        needed = self.context_builder.events_needed(self.history, character_info, user_input)
+        return needed > len(self.history.history_story.story)
+
+    def build_action_inputs(self, user_input: str):
+        character_info = self.character.__str__(language=self.language)
+        with tracer.span("context_build") as span:
+            inputs, usage = self.context_builder.build(self.history, character_info, user_input, self.event_index)
+            span.set("tokens", usage["total"])
+        self.context_usage = self.measure_prompt(inputs, usage)
+        return inputs
+
+    def measure_prompt(self, inputs: dict, usage: dict):
+        # bytes shared with the previous action prompt are what a provider-side prefix cache can reuse
+        with tracer.span("prompt_render") as span:
+            messages = self.action_prompt.format_messages(**inputs)
+            prompt = "".join(message.content for message in messages).encode("utf-8")
+            span.set("bytes", len(prompt))
+        usage["prompt_bytes"] = len(prompt)
+        # a prompt rendered from a different template (e.g. after a layout change) shares no reusable prefix
+        if self.action_prompt.hash != self.last_prompt_hash:
+            self.last_prompt = b""
+        usage["prefix_bytes"] = shared_prefix_len(prompt, self.last_prompt)
+        self.last_prompt = prompt
+        self.last_prompt_hash = self.action_prompt.hash
+        return usage
+
+    def build_story_inputs(self, story_framework: str):
+        return {"story_framework": story_framework, "character_info": self.character.__str__(language=self.language)}
+
+    def record_action(self, user_input: str, result: dict):
+        self.history.add_story("recent", story=result["narrative"], user_input=user_input)
+        self.save_history()
+
+        self.pending_compression = compression_pool.submit(
+            self.compress_story, user_input, result["narrative"], self.pending_compression
+        )
+
+    async def arecord_action(self, user_input: str, result: dict):
+        self.history.add_story("recent", story=result["narrative"], user_input=user_input)
+        await asyncio.to_thread(self.save_history)
+
+        self.pending_compression = asyncio.ensure_future(
+            self.acompress_story(user_input, result["narrative"], self.pending_compression)
+        )
+
+    def save_history(self):
+        with tracer.span("save_history") as span:
+            span.set("bytes", self.history.save_history())
+
+    def compress_story(self, user_input: str, narrative: str, previous=None):
+        with tracer.span("compression", root=True):
+            self.run_compression(user_input, narrative, previous)
+
+    def run_compression(self, user_input: str, narrative: str, previous=None):
         try:
-            action_output = self.action_chain.invoke(
-                {
-                    "story_framework": self.history.get_story("story_framework"),
-                    "character_info": self.character.__str__(language=self.language),
-                    "history_story": self.history.get_story("history"),
-                    "recent_story": self.history.get_story("recent"),
-                    "user_input": user_input,
-                }
+            compressed_result = self.invoke_chain(
+                "compression_chain", {"user_input": user_input, "story": narrative}, BACKGROUND
             )
+            event = parse_event(compressed_result)
+        except Exception as e:
+            print(f"Error compressing story: {str(e)}")
+            event = narrative
+
+        # events land in turn order even when compressions finish out of order
+        if previous is not None:
+            wait([previous])
 
-            result = parse_story(action_output)
+        self.history.add_story("history", story=event, user_input=user_input)
+        self.save_history()
+        if self.event_index is not None:
+            self.index_events()
 
-            self.history.add_story("recent", story=result["narrative"], user_input=user_input)
+        if self.history.next_summary() is not None:
+            self.pending_rollup = compression_pool.submit(self.rollup_history, self.pending_rollup)
 
-            compressed_result = self.compression_chain.invoke({"user_input": user_input, "story": result["narrative"]})
+    async def acompress_story(self, user_input: str, narrative: str, previous=None):
+        # background work gets its own trace rather than joining the turn that scheduled it
+        with tracer.span("compression", root=True):
+            await self.arun_compression(user_input, narrative, previous)
 
+    async def arun_compression(self, user_input: str, narrative: str, previous=None):
+        try:
+            compressed_result = await self.ainvoke_chain(
+                "compression_chain", {"user_input": user_input, "story": narrative}, BACKGROUND
+            )
             event = parse_event(compressed_result)
-            self.history.add_story("history", story=event, user_input=user_input)
-            self.history.save_history()
+        except Exception as e:
+            print(f"Error compressing story: {str(e)}")
+            event = narrative
+
+        if previous is not None:
+            await wait_future(previous)
+
+        self.history.add_story("history", story=event, user_input=user_input)
+        await asyncio.to_thread(self.save_history)
+        if self.event_index is not None:
+            await asyncio.to_thread(self.index_events)
+
+        if self.history.next_summary() is not None:
+            self.pending_rollup = asyncio.ensure_future(self.arollup_history(self.pending_rollup))
+
+    def rollup_history(self, previous=None):
+        # roll-ups are off the turn path; the prompt uses whichever summary nodes exist when it is built
+        if previous is not None:
+            wait([previous])
+
+        while (summary := self.history.next_summary()) is not None:
+            level, events = summary
+            with tracer.span("rollup", root=True, level=level):
+                try:
+                    summary = parse_event(self.invoke_chain("rollup_chain", events, BACKGROUND))
+                except Exception as e:
+                    print(f"Error summarizing story: {str(e)}")
+                    break
+                self.history.add_summary(level, summary)
+                self.save_history()
+
+    async def arollup_history(self, previous=None):
+        if previous is not None:
+            await wait_future(previous)
+
+        while (summary := self.history.next_summary()) is not None:
+            level, events = summary
+            with tracer.span("rollup", root=True, level=level):
+                try:
+                    summary = parse_event(await self.ainvoke_chain("rollup_chain", events, BACKGROUND))
+                except Exception as e:
+                    print(f"Error summarizing story: {str(e)}")
+                    break
+                self.history.add_summary(level, summary)
+                await asyncio.to_thread(self.save_history)
+
+    def wait_for_compression(self):
+        if isinstance(self.pending_compression, Future):
+            wait([self.pending_compression])
+
+    async def await_compression(self):
+        if self.pending_compression is not None:
+            await wait_future(self.pending_compression)
+
+    async def aclose(self):
+        self.closed = True
+        speculating = self.speculating
+        self.discard_speculations()
+        if speculating is not None:
+            await asyncio.wait([speculating])
+        await self.await_compression()
+        if self.pending_rollup is not None:
+            await wait_future(self.pending_rollup)
+        if self.history is not None and self.history.get_story("story_framework"):
+            await asyncio.to_thread(self.history.save_history)
+
+    async def acreate_character(self, character_info: str):
+        character_output = await self.ainvoke_chain("character_chain", character_info, SETUP)
+        character_info = parse_character(character_output)
+        self.character.set_info(character_info)
+        self.history.set_character(character_info)
+
+    async def asetup_new_game(self, story_framework: str, character_info: str):
+        with tracer.span("setup"):
+            self.history.add_story("story_framework", story=story_framework)
+            await self.acreate_character(character_info)
+
+            story_output = await self.ainvoke_chain("story_chain", self.build_story_inputs(story_framework), SETUP)
+            with tracer.span("parse"):
+                result = parse_story(story_output)
+            await self.arecord_action("", result)
+            self.initialized = True
 
-            return result
+        return result
 
-        except Exception as e:
-            error_message = f"Error processing action: {str(e)}"
-            print(error_message)
+    async def astream_story(self, story_framework: str):
+        with tracer.span("setup", mode="stream"):
+            story_parser = StreamParser(STORY_TAGS, stream_tags=("narrative",))
+            async for chunk in self.astream_chain("story_chain", self.build_story_inputs(story_framework), SETUP):
+                for event in story_parser.feed(chunk):
+                    yield event
 
-            print(self.system_contents.get_retry_action_message())
-            retry = input("\n> ").lower()
+            result = story_parser.close()
+            await self.arecord_action("", result)
+            self.initialized = True
+        yield ParseEvent("complete", "story", result)
 
-            if retry == "y" or retry == "yes":
-                print(self.system_contents.get_retrying_action_message())
-                return self.take_action(user_input)
+    async def atake_action(self, user_input: str):
+        if not self.initialized:
+            return {"narrative": self.system_contents.get_game_not_initialized_message(), "next_prompts": []}
+
+        with tracer.span("turn", mode="api") as span:
+            action_output = await self.aspeculated_output(user_input)
+            span.set("speculated", action_output is not None)
+            if action_output is None:
+                action_output = await self.ainvoke_chain(
+                    "action_chain", await self.aget_action_inputs(user_input), INTERACTIVE
+                )
+            with tracer.span("parse"):
+                result = parse_story(action_output)
+            result["context_usage"] = self.context_usage
+            await self.arecord_action(user_input, result)
+            self.start_speculation(result["next_prompts"])
+
+        return result
+
+    async def astream_action(self, user_input: str):
+        with tracer.span("turn", mode="stream") as span:
+            story_parser = StreamParser(STORY_TAGS, stream_tags=("narrative",))
+            action_output = await self.aspeculated_output(user_input)
+            span.set("speculated", action_output is not None)
+            if action_output is not None:
+                for event in story_parser.feed(action_output):
+                    yield event
             else:
-                return {
-                    "narrative": self.system_contents.get_failed_to_process_action_message(),
-                    "next_prompts": ["Try a different action", "Restart the game"],
-                }
+                async for chunk in self.astream_chain(
+                    "action_chain", await self.aget_action_inputs(user_input), INTERACTIVE
+                ):
+                    for event in story_parser.feed(chunk):
+                        yield event
+
+            result = story_parser.close()
+            result["context_usage"] = self.context_usage
+            await self.arecord_action(user_input, result)
+            self.start_speculation(result["next_prompts"])
+        yield ParseEvent("complete", "story", result)
+
+    def start_speculation(self, next_prompts: list[str]):
+        if self.speculative_k > 0 and next_prompts:
+            self.speculating = asyncio.ensure_future(self.speculate(next_prompts[: self.speculative_k]))
+
+    async def speculate(self, prompts: list[str]):
+        with tracer.span("speculation", root=True, prompts=len(prompts)):
+            # speculative turns are built on the settled history of this turn, so wait for its compression first
+            await self.await_compression()
+            if self.pending_rollup is not None:
+                await wait_future(self.pending_rollup)
+            if self.closed:
+                return
+
+            character_info = self.character.__str__(language=self.language)
+            self.speculation_seq = self.history.seq
+            for prompt in prompts:
+                inputs, usage = await asyncio.to_thread(
+                    self.context_builder.build, self.history, character_info, prompt, self.event_index
+                )
+                if self.closed:
+                    return
+                task = asyncio.ensure_future(self.ainvoke_chain("action_chain", inputs, SPECULATIVE))
+                self.speculations[prompt] = (inputs, usage, task)
+                speculation_stats["started"] += 1
+
+    async def aspeculated_output(self, user_input: str):
+        # a pre-generated turn is only served if nothing was added to the history since it was built
+        speculated = bool(self.speculations)
+        speculation = None
+        if self.speculation_seq == self.history.seq:
+            speculation = self.speculations.pop(user_input, None)
+        self.discard_speculations()
+        if speculation is None:
+            if speculated:
+                speculation_stats["misses"] += 1
+            return None
+
+        inputs, usage, task = speculation
+        try:
+            action_output = await task
+        except Exception as e:
+            print(f"Error in speculative turn: {str(e)}")
+            speculation_stats["misses"] += 1
+            return None
+        speculation_stats["hits"] += 1
+        self.context_usage = self.measure_prompt(inputs, usage)
+        return action_output
+
+    def discard_speculations(self):
+        # a speculation still building its inputs is cancelled along with the calls already started
+        if self.speculating is not None and not self.speculating.done():
+            self.speculating.cancel()
+        self.speculating = None
+        for _, _, task in self.speculations.values():
+            task.cancel()
+            speculation_stats["discarded"] += 1
+        self.speculations = {}
+        self.speculation_seq = None
 
     def load_game_state(self):
-        if os.path.exists(self.file_path):
+        if self.history.exists():
             success = self.history.load_history()
+            if success and self.history.character_info:
+                self.character.set_info(self.history.character_info)
             return success and bool(self.history.get_story("story_framework"))
         return False
 
 
+async def wait_future(future):
+    # pending compressions and roll-ups are thread-pool futures on the CLI path and tasks on the async path
+    if isinstance(future, Future):
+        future = asyncio.wrap_future(future)
+    await asyncio.wait([future])
+
+
 if __name__ == "__main__":
     game = TextAdventureGame()
     game.start_game()
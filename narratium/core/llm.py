@@ -0,0 +1,232 @@
+import importlib
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
+from narratium.core.cache import response_cache
+from narratium.prompts.system_prompts import SystemPrompts
+from narratium.prompts.templates import ChatTemplate
+
+load_dotenv()
+url = os.getenv("QWQ_URL")
+api_key = os.getenv("QWQ_API_KEY")
+ollama_model = os.getenv("OLLAMA_MODEL")
+ollama_url = os.getenv("OLLAMA_URL")
+http_max_connections = int(os.getenv("NARRATIUM_HTTP_MAX_CONNECTIONS", "100"))
+http_keepalive_connections = int(os.getenv("NARRATIUM_HTTP_KEEPALIVE_CONNECTIONS", "20"))
+http_keepalive_expiry = float(os.getenv("NARRATIUM_HTTP_KEEPALIVE_EXPIRY", "60"))
+prompt_layout = os.getenv("NARRATIUM_PROMPT_LAYOUT", "default")
+failover_threshold = int(os.getenv("NARRATIUM_FAILOVER_THRESHOLD", "2"))
+failover_cooldown = float(os.getenv("NARRATIUM_FAILOVER_COOLDOWN", "60"))
+# provider SDKs are imported when a session first uses them; listed types are imported at startup instead
+preload_providers = [name.strip() for name in os.getenv("NARRATIUM_PRELOAD_PROVIDERS", "").split(",") if name.strip()]
+
+PROVIDER_CLASSES = {
+    "openai": ("langchain_openai", "ChatOpenAI"),
+    "ollama": ("langchain_ollama", "ChatOllama"),
+    "stub": ("narratium.core.stub", "StubChat"),
+}
+
+
+def provider_class(type: str):
+    if type not in PROVIDER_CLASSES:
+        raise ValueError(f"Unknown LLM type: {type}")
+    module, name = PROVIDER_CLASSES[type]
+    return getattr(importlib.import_module(module), name)
+
+
+class ChainSet:
+    def __init__(self, llm, language: str, layout: str = prompt_layout, cache=response_cache):
+        system_prompts = SystemPrompts(language=language)
+        self.llm = llm
+        # character generation, compression and roll-ups are pure functions of their prompt and are served from
+        # the response cache; the narrative chains keep the uncached client
+        self.cached_llm = llm.model_copy(update={"cache": cache}) if cache is not None else llm
+
+        character_prompt = ChatTemplate([("human", system_prompts.template("character_easy"))])
+        self.character_chain = (
+            {"character_info": RunnablePassthrough()}
+            | RunnableLambda(character_prompt.format)
+            | self.cached_llm
+            | StrOutputParser()
+        )
+
+        system_prompt = system_prompts.get_text_adventure_prompt()
+        story_prompt = ChatTemplate([("system", system_prompt), ("human", system_prompts.template("setting"))])
+        self.story_chain = (
+            {"story_framework": lambda x: x["story_framework"], "character_info": lambda x: x["character_info"]}
+            | RunnableLambda(story_prompt.format)
+            | llm
+            | StrOutputParser()
+        )
+
+        if layout == "stable":
+            # fixed instructions lead and per-turn data trails, so consecutive turns share a long prefix
+            action_prompt = ChatTemplate(
+                [
+                    ("system", system_prompt + system_prompts.get_action_instructions_prompt()),
+                    ("human", system_prompts.template("stable_story")),
+                ]
+            )
+        else:
+            action_prompt = ChatTemplate(
+                [("system", system_prompt), ("human", system_prompts.template("embedded_story"))]
+            )
+        self.action_prompt = action_prompt
+        self.action_chain = (
+            {
+                "story_framework": lambda x: x["story_framework"],
+                "character_info": lambda x: x["character_info"],
+                "history_story": lambda x: x["history_story"],
+                "recalled_story": lambda x: x["recalled_story"],
+                "recent_story": lambda x: x["recent_story"],
+                "user_input": lambda x: x["user_input"],
+            }
+            | RunnableLambda(action_prompt.format)
+            | llm
+            | StrOutputParser()
+        )
+
+        compression_prompt = ChatTemplate([("human", system_prompts.template("story_compressor"))])
+        self.compression_chain = (
+            {"user_input": lambda x: x["user_input"], "story": lambda x: x["story"]}
+            | RunnableLambda(compression_prompt.format)
+            | self.cached_llm
+            | StrOutputParser()
+        )
+
+        rollup_prompt = ChatTemplate([("human", system_prompts.template("story_rollup"))])
+        self.rollup_chain = (
+            {"events": RunnablePassthrough()}
+            | RunnableLambda(rollup_prompt.format)
+            | self.cached_llm
+            | StrOutputParser()
+        )
+
+
+class LLMRegistry:
+    # clients and chains are stateless runnables, so one instance per key is shared by every game
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.chain_sets = {}
+        self.http_client = None
+        self.http_async_client = None
+        self.failures = {}
+        self.degraded_until = {}
+
+    def get_llm(self, type: str, model: str):
+        key = (type, model)
+        with self.lock:
+            if key not in self.clients:
+                self.clients[key] = self.create_llm(type, model)
+            return self.clients[key]
+
+    def get_chains(self, type: str, model: str, language: str) -> ChainSet:
+        llm = self.get_llm(type, model)
+        key = (type, model, language)
+        with self.lock:
+            if key not in self.chain_sets:
+                self.chain_sets[key] = ChainSet(llm, language)
+            return self.chain_sets[key]
+
+    def fallback(self, type: str, model: str):
+        # the local Ollama model backs up any other provider
+        if type in ("ollama", "stub") or not ollama_model:
+            return None
+        return "ollama", ollama_model
+
+    def record_failure(self, type: str, model: str):
+        # after failover_threshold transient failures in a row the provider is skipped for failover_cooldown seconds
+        key = (type, model)
+        with self.lock:
+            self.failures[key] = self.failures.get(key, 0) + 1
+            if self.failures[key] >= failover_threshold:
+                self.failures[key] = 0
+                self.degraded_until[key] = time.monotonic() + failover_cooldown
+                print(f"Error: LLM provider {type}/{model} degraded, failing over for {failover_cooldown:.0f}s")
+
+    def record_success(self, type: str, model: str):
+        self.failures.pop((type, model), None)
+
+    def is_degraded(self, type: str, model: str):
+        return time.monotonic() < self.degraded_until.get((type, model), 0)
+
+    def create_llm(self, type: str, model: str):
+        try:
+            if type == "openai":
+                return provider_class("openai")(
+                    model=model,
+                    api_key=api_key,
+                    base_url=url,
+                    temperature=0.9,
+                    max_tokens=2000,
+                    streaming=True,
+                    # RetryPolicy is the only retry layer; SDK retries would multiply attempts and delay failover
+                    max_retries=0,
+                    http_client=self.get_http_client(),
+                    http_async_client=self.get_http_async_client(),
+                )
+            elif type == "ollama":
+                return provider_class("ollama")(
+                    model=model,
+                    base_url=ollama_url,
+                    temperature=0.9,
+                    max_tokens=2000,
+                    streaming=True,
+                )
+            elif type == "stub":
+                # canned local output for benchmarks; the model name is ignored
+                return provider_class("stub")()
+            else:
+                raise ValueError(f"Unknown LLM type: {type}")
+        except Exception as e:
+            print(f"Error setting up LLM: {str(e)}")
+            try:
+                return provider_class("ollama")(
+                    model=ollama_model,
+                    base_url=ollama_url,
+                    temperature=0.9,
+                    max_tokens=2000,
+                    streaming=True,  # 启用流式输出
+                )
+            except Exception as e:
+                print(f"Error setting up Ollama LLM: {str(e)}")
+                raise RuntimeError("Failed to initialize any LLM")
+
+    def preload(self, types: list[str] = preload_providers):
+        for type in types:
+            try:
+                provider_class(type)
+            except Exception as e:
+                print(f"Error preloading LLM provider {type}: {str(e)}")
+
+    def http_limits(self):
+        import httpx
+
+        return httpx.Limits(
+            max_connections=http_max_connections,
+            max_keepalive_connections=http_keepalive_connections,
+            keepalive_expiry=http_keepalive_expiry,
+        )
+
+    def get_http_client(self):
+        if self.http_client is None:
+            import httpx
+
+            self.http_client = httpx.Client(limits=self.http_limits())
+        return self.http_client
+
+    def get_http_async_client(self):
+        if self.http_async_client is None:
+            import httpx
+
+            self.http_async_client = httpx.AsyncClient(limits=self.http_limits())
+        return self.http_async_client
+
+
+registry = LLMRegistry()
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import random
+import sys
+import time
+
+retry_attempts = int(os.getenv("NARRATIUM_RETRY_ATTEMPTS", "3"))
+retry_base_delay = float(os.getenv("NARRATIUM_RETRY_BASE_DELAY", "1.0"))
+retry_max_delay = float(os.getenv("NARRATIUM_RETRY_MAX_DELAY", "16"))
+retry_jitter = float(os.getenv("NARRATIUM_RETRY_JITTER", "0.5"))
+
+# transient upstream failures; anything else (bad request, auth, parsing) fails on the first attempt
+RETRYABLE_ERRORS = (ConnectionError, TimeoutError)
+# client library errors by module and class name, looked up only once the provider has been imported
+RETRYABLE_CLIENT_ERRORS = {
+    "httpx": ("TransportError",),
+    "openai": ("APIConnectionError", "RateLimitError", "InternalServerError"),
+}
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+
+def retryable_errors():
+    # a library that is not imported yet cannot have raised anything
+    errors = RETRYABLE_ERRORS
+    for module, names in RETRYABLE_CLIENT_ERRORS.items():
+        if module in sys.modules:
+            errors += tuple(getattr(sys.modules[module], name) for name in names)
+    return errors
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = retry_attempts,
+        base_delay: float = retry_base_delay,
+        max_delay: float = retry_max_delay,
+        jitter: float = retry_jitter,
+        retryable: tuple | None = None,
+        retryable_status: tuple = RETRYABLE_STATUS,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retryable = retryable
+        self.retryable_status = retryable_status
+
+    def is_retryable(self, e: Exception):
+        # errors such as ollama's ResponseError only carry the HTTP status
+        return (
+            isinstance(e, self.retryable or retryable_errors())
+            or getattr(e, "status_code", None) in self.retryable_status
+        )
+
+    def should_retry(self, e: Exception, attempt: int):
+        return attempt < self.max_attempts and self.is_retryable(e)
+
+    def delay(self, attempt: int):
+        # exponential backoff capped at max_delay, shortened by up to jitter of itself
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def retrying(self, e: Exception, attempt: int):
+        delay = self.delay(attempt)
+        print(f"Error calling LLM, retrying in {delay:.1f}s ({attempt}/{self.max_attempts}): {str(e)}")
+        return delay
+
+    def call(self, fn):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return fn()
+            except Exception as e:
+                if not self.should_retry(e, attempt):
+                    raise
+                time.sleep(self.retrying(e, attempt))
+
+    async def acall(self, fn):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await fn()
+            except Exception as e:
+                if not self.should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self.retrying(e, attempt))
@@ -0,0 +1,214 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+llm_concurrency = int(os.getenv("NARRATIUM_LLM_CONCURRENCY", "16"))
+llm_rate = float(os.getenv("NARRATIUM_LLM_RATE", "0"))
+llm_burst = float(os.getenv("NARRATIUM_LLM_BURST", "0"))
+llm_background_share = float(os.getenv("NARRATIUM_LLM_BACKGROUND_SHARE", "0.5"))
+
+INTERACTIVE = 0
+SETUP = 1
+BACKGROUND = 2
+SPECULATIVE = 3
+PRIORITY_NAMES = {INTERACTIVE: "interactive", SETUP: "setup", BACKGROUND: "background", SPECULATIVE: "speculative"}
+
+
+class Waiter:
+    def __init__(self, priority: int, loop=None):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.resolve)
+
+    def resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ProviderQueue:
+    # admission for one upstream provider: a concurrency cap, a token bucket and a priority heap of waiters
+    def __init__(self, name: str, concurrency: int, rate: float, burst: float, background_share: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        # without an explicit burst the bucket holds one second of requests
+        self.burst = burst if burst >= 1 else max(rate, 1)
+        # background work never takes every slot, so an interactive turn is not stuck behind a compression backlog
+        self.background_limit = max(1, math.ceil(self.concurrency * background_share))
+        self.tokens = self.burst
+        self.refilled = time.monotonic()
+        self.timer = None
+        self.active = 0
+        self.active_background = 0
+        self.waiters = []
+        self.counter = itertools.count()
+        self.granted = {priority: 0 for priority in PRIORITY_NAMES}
+        self.wait_total = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.wait_max = {priority: 0.0 for priority in PRIORITY_NAMES}
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def dispatch(self, lock):
+        # called with lock held
+        while self.waiters and self.active < self.concurrency:
+            priority, _, waiter = self.waiters[0]
+            if waiter.cancelled:
+                heapq.heappop(self.waiters)
+                continue
+            if priority >= BACKGROUND and self.active_background >= self.background_limit:
+                # the heap top is background work, so nothing of higher priority is waiting
+                break
+            if self.rate > 0:
+                self.refill()
+                if self.tokens < 1:
+                    self.wake_later((1 - self.tokens) / self.rate, lock)
+                    break
+                self.tokens -= 1
+            heapq.heappop(self.waiters)
+            self.active += 1
+            if priority >= BACKGROUND:
+                self.active_background += 1
+            waited = time.monotonic() - waiter.enqueued
+            self.granted[priority] += 1
+            self.wait_total[priority] += waited
+            self.wait_max[priority] = max(self.wait_max[priority], waited)
+            waiter.grant()
+
+    def wake_later(self, delay: float, lock):
+        if self.timer is not None:
+            return
+
+        def wake():
+            with lock:
+                self.timer = None
+                self.dispatch(lock)
+
+        self.timer = threading.Timer(delay, wake)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def stats(self):
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, waiter in self.waiters:
+            if not waiter.cancelled:
+                depth[PRIORITY_NAMES[priority]] += 1
+        return {
+            "active": self.active,
+            "active_background": self.active_background,
+            "concurrency": self.concurrency,
+            "background_limit": self.background_limit,
+            "rate": self.rate,
+            "tokens": round(self.tokens, 2) if self.rate > 0 else None,
+            "queue_depth": depth,
+            "granted": {PRIORITY_NAMES[p]: count for p, count in self.granted.items()},
+            "wait_avg": {
+                PRIORITY_NAMES[p]: (self.wait_total[p] / count if count else 0.0) for p, count in self.granted.items()
+            },
+            "wait_max": {PRIORITY_NAMES[p]: wait for p, wait in self.wait_max.items()},
+        }
+
+
+class LLMScheduler:
+    # every chain call of a game takes a slot here; works for worker threads and the event loop alike
+    def __init__(
+        self,
+        concurrency: int = llm_concurrency,
+        rate: float = llm_rate,
+        burst: float = llm_burst,
+        background_share: float = llm_background_share,
+    ):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.background_share = background_share
+        self.lock = threading.Lock()
+        self.providers = {}
+
+    def provider(self, name: str) -> ProviderQueue:
+        # called with lock held; NARRATIUM_LLM_CONCURRENCY_<PROVIDER> and NARRATIUM_LLM_RATE_<PROVIDER> override
+        if name not in self.providers:
+            key = name.upper()
+            self.providers[name] = ProviderQueue(
+                name,
+                int(os.getenv(f"NARRATIUM_LLM_CONCURRENCY_{key}", self.concurrency)),
+                float(os.getenv(f"NARRATIUM_LLM_RATE_{key}", self.rate)),
+                float(os.getenv(f"NARRATIUM_LLM_BURST_{key}", self.burst)),
+                self.background_share,
+            )
+        return self.providers[name]
+
+    def enqueue(self, name: str, waiter: Waiter):
+        with self.lock:
+            queue = self.provider(name)
+            heapq.heappush(queue.waiters, (waiter.priority, next(queue.counter), waiter))
+            queue.dispatch(self.lock)
+
+    def acquire(self, name: str, priority: int):
+        waiter = Waiter(priority)
+        self.enqueue(name, waiter)
+        waiter.event.wait()
+
+    async def aacquire(self, name: str, priority: int):
+        waiter = Waiter(priority, asyncio.get_running_loop())
+        self.enqueue(name, waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self.lock:
+                granted = waiter.granted
+                waiter.cancelled = True
+            if granted:
+                self.release(name, priority)
+            raise
+
+    def release(self, name: str, priority: int):
+        with self.lock:
+            queue = self.providers[name]
+            queue.active -= 1
+            if priority >= BACKGROUND:
+                queue.active_background -= 1
+            queue.dispatch(self.lock)
+
+    @contextmanager
+    def slot(self, name: str, priority: int):
+        self.acquire(name, priority)
+        try:
+            yield
+        finally:
+            self.release(name, priority)
+
+    @asynccontextmanager
+    async def aslot(self, name: str, priority: int):
+        await self.aacquire(name, priority)
+        try:
+            yield
+        finally:
+            self.release(name, priority)
+
+    def stats(self):
+        with self.lock:
+            return {name: queue.stats() for name, queue in self.providers.items()}
+
+
+scheduler = LLMScheduler()
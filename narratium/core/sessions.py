@@ -0,0 +1,258 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+max_sessions = int(os.getenv("NARRATIUM_MAX_SESSIONS", "1000"))
+session_ttl = float(os.getenv("NARRATIUM_SESSION_TTL", "3600"))
+session_memory_mb = float(os.getenv("NARRATIUM_SESSION_MEMORY_MB", "512"))
+# configs kept for rehydrating evicted games; older ones are read back from their stored history
+max_configs = int(os.getenv("NARRATIUM_MAX_SESSION_CONFIGS", "10000"))
+# what a request does while another turn of the same game is running: queue, reject or coalesce
+turn_policy = os.getenv("NARRATIUM_TURN_POLICY", "queue")
+
+
+class SessionBusy(Exception):
+    pass
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+# rough fixed cost of a live game (prompts, chains, character) on top of its history text
+SESSION_BASE_BYTES = 64 * 1024
+
+
+class SessionManager:
+    def __init__(
+        self,
+        create_game,
+        load_config=None,
+        max_sessions: int = max_sessions,
+        ttl: float = session_ttl,
+        max_memory_mb: float = session_memory_mb,
+        turn_policy: str = turn_policy,
+        max_configs: int = max_configs,
+    ):
+        self.create_game = create_game
+        # reads the stored config of a game that is not in memory, None when it has no history
+        self.load_config = load_config
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_memory = int(max_memory_mb * 1024 * 1024)
+        self.sessions = OrderedDict()
+        self.last_used = {}
+        self.configs = OrderedDict()
+        self.max_configs = max_configs
+        self.holds = {}
+        self.closing = {}
+        self.loading = {}
+        self.turn_policy = turn_policy
+        self.locks = {}
+        self.turn_users = {}
+        self.inflight = {}
+        self.queued = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.evicted = 0
+        self.expired = 0
+        self.rehydrated = 0
+
+    def add(self, game_id: str, game, **config):
+        self.sessions[game_id] = game
+        self.last_used[game_id] = time.monotonic()
+        self.remember(game_id, config)
+        self.evict()
+
+    def remember(self, game_id: str, config: dict):
+        self.configs[game_id] = config
+        self.configs.move_to_end(game_id)
+        while len(self.configs) > max(self.max_configs, 1):
+            self.configs.popitem(last=False)
+
+    async def get(self, game_id: str):
+        game = self.sessions.get(game_id)
+        if game is None:
+            # concurrent requests for an evicted game share a single rehydration
+            if game_id not in self.loading:
+                self.loading[game_id] = asyncio.ensure_future(self.rehydrate(game_id))
+            game = await self.loading[game_id]
+            if game is None:
+                return None
+        self.sessions.move_to_end(game_id)
+        self.last_used[game_id] = time.monotonic()
+        self.evict()
+        return game
+
+    async def rehydrate(self, game_id: str):
+        try:
+            if game_id in self.closing:
+                await self.closing[game_id]
+            config = self.configs.get(game_id)
+            if config is None and self.load_config is not None:
+                config = await asyncio.to_thread(self.load_config, game_id)
+            # unknown ids without a stored history are never built
+            if config is None:
+                return None
+            game = await asyncio.to_thread(self.create_game, game_id, **config)
+        except Exception as e:
+            print(f"Error rehydrating session {game_id}: {str(e)}")
+            return None
+        finally:
+            self.loading.pop(game_id, None)
+
+        self.remember(game_id, config)
+        self.sessions[game_id] = game
+        self.last_used[game_id] = time.monotonic()
+        self.rehydrated += 1
+        return game
+
+    def acquire(self, game_id: str):
+        # held sessions are mid-turn and are never evicted
+        self.holds[game_id] = self.holds.get(game_id, 0) + 1
+
+    def release(self, game_id: str):
+        self.holds[game_id] -= 1
+        if not self.holds[game_id]:
+            del self.holds[game_id]
+        if game_id in self.sessions:
+            self.last_used[game_id] = time.monotonic()
+
+    @contextmanager
+    def hold(self, game_id: str):
+        self.acquire(game_id)
+        try:
+            yield
+        finally:
+            self.release(game_id)
+
+    @asynccontextmanager
+    async def turn(self, game_id: str, policy: str | None = None):
+        # one turn at a time per game, so history records and saves never interleave
+        policy = policy or self.turn_policy
+        lock = self.locks.setdefault(game_id, asyncio.Lock())
+        if lock.locked():
+            if policy == "reject":
+                self.rejected += 1
+                raise SessionBusy(game_id)
+            self.queued += 1
+        self.turn_users[game_id] = self.turn_users.get(game_id, 0) + 1
+        try:
+            with self.hold(game_id):
+                async with lock:
+                    yield
+        finally:
+            self.turn_users[game_id] -= 1
+            if not self.turn_users[game_id]:
+                del self.turn_users[game_id]
+                del self.locks[game_id]
+
+    @asynccontextmanager
+    async def game_turn(self, game_id: str, policy: str | None = None):
+        # the game is fetched once the turn is held: a session evicted while the request waited is rehydrated,
+        # instead of the stale object and its rehydrated copy both writing the same history
+        async with self.turn(game_id, policy):
+            game = await self.get(game_id)
+            if game is None:
+                raise SessionNotFound(game_id)
+            yield game
+
+    async def run_turn(self, game_id: str, key: str, turn):
+        # with coalesce, a request identical to one already in flight for the game shares its result
+        if self.turn_policy != "coalesce":
+            async with self.game_turn(game_id) as game:
+                return await turn(game)
+
+        task = self.inflight.get((game_id, key))
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # held from now rather than from when the task first runs, so the session cannot be evicted in between
+            self.acquire(game_id)
+            task = asyncio.ensure_future(self.locked_turn(game_id, turn))
+            self.inflight[(game_id, key)] = task
+            task.add_done_callback(lambda _: self.inflight.pop((game_id, key), None))
+            task.add_done_callback(lambda _: self.release(game_id))
+        # a caller that goes away does not cancel the turn for the others
+        return await asyncio.shield(task)
+
+    async def locked_turn(self, game_id: str, turn):
+        async with self.game_turn(game_id, "queue") as game:
+            return await turn(game)
+
+    def busy(self, game_id: str):
+        lock = self.locks.get(game_id)
+        return lock is not None and lock.locked()
+
+    def evict(self):
+        now = time.monotonic()
+        for game_id in list(self.sessions):
+            if now - self.last_used[game_id] < self.ttl:
+                break
+            if game_id not in self.holds:
+                self.remove(game_id)
+                self.expired += 1
+
+        memory = self.memory_usage()
+        for game_id in list(self.sessions):
+            if len(self.sessions) <= max(self.max_sessions, 1) and memory <= self.max_memory:
+                break
+            if len(self.sessions) == 1:
+                break
+            if game_id in self.holds:
+                continue
+            memory -= self.session_size(self.sessions[game_id])
+            self.remove(game_id)
+            self.evicted += 1
+
+    def remove(self, game_id: str):
+        game = self.sessions.pop(game_id)
+        del self.last_used[game_id]
+        self.closing[game_id] = asyncio.ensure_future(self.close(game_id, game))
+
+    async def close(self, game_id: str, game):
+        try:
+            await game.aclose()
+        except Exception as e:
+            print(f"Error closing session {game_id}: {str(e)}")
+        finally:
+            self.closing.pop(game_id, None)
+
+    async def close_all(self):
+        # flushes every live session, e.g. before the process exits
+        for game_id in list(self.sessions):
+            self.remove(game_id)
+        await asyncio.gather(*list(self.closing.values()))
+
+    def history_size(self, game):
+        history = game.history
+        return history.size() if history is not None else 0
+
+    def session_size(self, game):
+        return SESSION_BASE_BYTES + self.history_size(game)
+
+    def memory_usage(self):
+        return sum(self.session_size(game) for game in self.sessions.values())
+
+    def stats(self):
+        return {
+            "live": len(self.sessions),
+            "dormant": len(self.configs.keys() - self.sessions.keys()),
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "rehydrated": self.rehydrated,
+            "closing": len(self.closing),
+            "active_turns": sum(lock.locked() for lock in self.locks.values()),
+            "queued_turns": self.queued,
+            "rejected_turns": self.rejected,
+            "coalesced_turns": self.coalesced,
+            "turn_policy": self.turn_policy,
+            "memory_bytes": self.memory_usage(),
+            # memory_bytes without the fixed per-session estimate
+            "history_bytes": sum(self.history_size(game) for game in self.sessions.values()),
+            "max_sessions": self.max_sessions,
+            "max_memory_bytes": self.max_memory,
+            "ttl": self.ttl,
+        }
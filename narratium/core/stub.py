@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+stub_tokens_per_second = float(os.getenv("NARRATIUM_STUB_TOKENS_PER_SECOND", "100"))
+stub_first_token_delay = float(os.getenv("NARRATIUM_STUB_FIRST_TOKEN_DELAY", "0.2"))
+
+TOKEN_PATTERN = re.compile(r"\s*\S+|\s+")
+
+SCENES = [
+    "The corridor narrows and the torchlight gutters against wet stone.",
+    "A merchant's cart lies overturned by the road, its wheels still turning.",
+    "Somewhere above, a bell rings three times and falls silent.",
+    "The air smells of rain and old smoke, and the ground is soft underfoot.",
+    "A stranger in a grey cloak watches from the far side of the square.",
+    "The door gives way with a groan, revealing a room thick with dust.",
+    "Footprints lead away from the river toward the dark line of the forest.",
+    "A folded letter, sealed in red wax, rests on the table before you.",
+]
+ACTIONS = [
+    "Follow the footprints",
+    "Talk to the stranger",
+    "Search the room",
+    "Open the letter",
+    "Head back to the village",
+    "Climb toward the bell tower",
+    "Wait and listen",
+    "Light another torch",
+]
+
+
+def stub_reply(prompt: str) -> str:
+    # canned tagged output for each chain, seeded by the prompt so a run is reproducible
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+    if "<events>" in prompt:
+        return f"<event>\n{' '.join(rng.sample(SCENES, 2))}\n</event>"
+    if "<story>" in prompt:
+        return "\n".join(f"- {scene}" for scene in rng.sample(SCENES, 2))
+    if "<name>" in prompt:
+        return (
+            "<name>Ash</name>\n<description>A wary traveller.</description>\n<personality>Curious, stubborn</personality>\n"
+            "<background>Raised on the river docks.</background>\n<appearance>Tall, scarred hands</appearance>\n"
+            "<skills>Tracking, lockpicking</skills>\n<location>The old town</location>\n<status>Healthy</status>"
+        )
+    narrative = " ".join(rng.sample(SCENES, 4))
+    prompts = "\n".join(f"- {action}" for action in rng.sample(ACTIONS, 3))
+    return (
+        "<analysis>\nThe player acts; the scene moves on.\n</analysis>\n"
+        f"<narrative>\n{narrative}\n</narrative>\n<next_prompts>\n{prompts}\n</next_prompts>"
+    )
+
+
+class StubChat(BaseChatModel):
+    # local stand-in for a provider: streams canned output at a fixed rate, for benchmarks and load tests
+    tokens_per_second: float = stub_tokens_per_second
+    first_token_delay: float = stub_first_token_delay
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def reply_tokens(self, messages) -> list[str]:
+        return TOKEN_PATTERN.findall(stub_reply("\n".join(str(message.content) for message in messages)))
+
+    def token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self.reply_tokens(messages)
+        time.sleep(self.first_token_delay + len(tokens) * self.token_delay())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self.reply_tokens(messages)
+        await asyncio.sleep(self.first_token_delay + len(tokens) * self.token_delay())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_delay)
+        for token in self.reply_tokens(messages):
+            time.sleep(self.token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_delay)
+        for token in self.reply_tokens(messages):
+            await asyncio.sleep(self.token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
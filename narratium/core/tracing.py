@@ -0,0 +1,284 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+
+tracing_enabled = os.getenv("NARRATIUM_TRACING", "on") != "off"
+trace_buffer = int(os.getenv("NARRATIUM_TRACE_BUFFER", "200"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def label_text(labelnames: tuple, labels: tuple, extra: str = ""):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    # Prometheus histogram: one cumulative bucket row per label combination, rendered at scrape time
+    def __init__(self, name: str, help: str, buckets: tuple, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # per-bucket counts, then +Inf, then the sum
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {labels: list(counts) for labels, counts in self.series.items()}
+        for labels, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket = label_text(self.labelnames, labels, f'le="{format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            cumulative += counts[len(self.buckets)]
+            bucket = label_text(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            lines.append(f"{self.name}_sum{label_text(self.labelnames, labels)} {counts[-1]}")
+            lines.append(f"{self.name}_count{label_text(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, *labels, value: float = 1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            series = dict(self.series)
+        for labels, value in sorted(series.items()):
+            lines.append(f"{self.name}{label_text(self.labelnames, labels)} {value}")
+        return lines
+
+
+def stat_lines(name: str, help: str, samples: list[tuple[dict, float]], type: str = "gauge") -> list[str]:
+    # values read from the existing stats() at scrape time
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{label_text(tuple(labels), tuple(labels.values()))} {value}")
+    return lines
+
+
+class NullSpan:
+    # returned while tracing is off; falsy so callers can skip computing span attributes
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __bool__(self):
+        return False
+
+    def set(self, key: str, value):
+        pass
+
+    def add(self, key: str, value):
+        pass
+
+    def close(self, error: BaseException | None = None):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "stage", "attrs", "parent", "children", "started", "start", "duration", "token")
+
+    def __init__(self, tracer, stage: str, parent, attrs: dict):
+        self.tracer = tracer
+        self.stage = stage
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.token = None
+
+    def __enter__(self):
+        self.token = self.tracer.current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.tracer.current.reset(self.token)
+        except ValueError:
+            # an async generator closed from another context, e.g. a client that disconnected mid-stream
+            pass
+        self.close(exc)
+        return False
+
+    def close(self, error: BaseException | None = None):
+        # ends a span that was never made current, e.g. one held across the yields of an async generator
+        self.duration = time.perf_counter() - self.start
+        if error is not None:
+            self.attrs["error"] = type(error).__name__
+        self.tracer.finish(self)
+
+    def __bool__(self):
+        return True
+
+    def set(self, key: str, value):
+        self.attrs[key] = value
+
+    def add(self, key: str, value):
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            "started": self.started,
+            "duration": self.duration,
+            **self.attrs,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class Tracer:
+    # spans nest through a context variable, so a turn's stages form one tree across awaits and to_thread calls
+    def __init__(self, enabled: bool = tracing_enabled, buffer: int = trace_buffer):
+        self.enabled = enabled
+        self.current = contextvars.ContextVar("narratium_span", default=None)
+        self.traces = deque(maxlen=buffer)
+        self.stage_seconds = Histogram(
+            "narratium_stage_seconds", "Duration of game and API stages", LATENCY_BUCKETS, ("stage",)
+        )
+        self.stage_tokens = Histogram("narratium_stage_tokens", "Tokens handled by a stage", TOKEN_BUCKETS, ("stage",))
+        self.stage_bytes = Histogram(
+            "narratium_stage_bytes", "Bytes written or rendered by a stage", BYTE_BUCKETS, ("stage",)
+        )
+        self.queue_wait = Histogram(
+            "narratium_llm_queue_wait_seconds",
+            "Time an LLM call waited for a scheduler slot",
+            LATENCY_BUCKETS,
+            ("stage", "provider"),
+        )
+        self.first_chunk = Histogram(
+            "narratium_llm_first_chunk_seconds",
+            "Time from a streamed LLM call's slot grant to its first chunk",
+            LATENCY_BUCKETS,
+            ("stage", "provider"),
+        )
+        self.stage_errors = Counter("narratium_stage_errors_total", "Stages that ended with an exception", ("stage",))
+        self.http_seconds = Histogram(
+            "narratium_http_request_seconds",
+            "API handler time until the response starts",
+            LATENCY_BUCKETS,
+            ("method", "route", "status"),
+        )
+
+    def span(self, stage: str, root: bool = False, **attrs):
+        # root spans start a new trace, for background work that outlives the turn that scheduled it
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage, None if root else self.current.get(), attrs)
+
+    def finish(self, span: Span):
+        attrs = span.attrs
+        self.stage_seconds.observe(span.duration, span.stage)
+        if "tokens" in attrs:
+            self.stage_tokens.observe(attrs["tokens"], span.stage)
+        if "bytes" in attrs:
+            self.stage_bytes.observe(attrs["bytes"], span.stage)
+        if "queue_wait" in attrs:
+            self.queue_wait.observe(attrs["queue_wait"], span.stage, attrs.get("provider", ""))
+        if "first_chunk" in attrs:
+            self.first_chunk.observe(attrs["first_chunk"], span.stage, attrs.get("provider", ""))
+        if "error" in attrs:
+            self.stage_errors.inc(span.stage)
+        if span.parent is not None:
+            span.parent.children.append(span)
+        else:
+            self.traces.append(span)
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        if self.enabled:
+            self.http_seconds.observe(seconds, method, route, status)
+
+    def recent(self, limit: int = 20, min_duration: float = 0.0, stage: str | None = None):
+        traces = [
+            span
+            for span in reversed(self.traces)
+            if span.duration >= min_duration and (stage is None or span.stage == stage)
+        ]
+        return [span.to_dict() for span in traces[:limit]]
+
+    def render(self) -> list[str]:
+        lines = []
+        for metric in (
+            self.stage_seconds,
+            self.stage_tokens,
+            self.stage_bytes,
+            self.queue_wait,
+            self.first_chunk,
+            self.stage_errors,
+            self.http_seconds,
+        ):
+            lines.extend(metric.render())
+        return lines
+
+
+tracer = Tracer()
+
+
+class RequestTimingMiddleware:
+    # plain ASGI middleware: times each request until its response starts, labelled by route template
+    def __init__(self, app, tracer=tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                self.tracer.observe_request(
+                    scope["method"],
+                    getattr(route, "path", "unmatched"),
+                    message["status"],
+                    time.perf_counter() - started,
+                )
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
@@ -0,0 +1,190 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+
+storage = os.getenv("NARRATIUM_STORAGE", "file")
+db_path = os.getenv("NARRATIUM_DB_PATH", "narratium.db")
+sqlite_commit_every = int(os.getenv("NARRATIUM_SQLITE_COMMIT_EVERY", "32"))
+sqlite_commit_interval = float(os.getenv("NARRATIUM_SQLITE_COMMIT_INTERVAL", "1.0"))
+
+# lives in narratium.db next to game_sessions; the primary key doubles as the (session_id, seq) index
+# seq is the history record sequence number, so setup and compression records have rows too
+GAME_TURNS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS game_turns (
+    session_id VARCHAR NOT NULL,
+    seq INTEGER NOT NULL,
+    kind VARCHAR NOT NULL,
+    user_input TEXT,
+    text TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID
+"""
+
+
+class JournalStore:
+    # JSON Lines journal next to a JSON snapshot that is only rewritten on compaction
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.journal_path = file_path + ".journal"
+        self.journal_records = 0
+
+    def exists(self):
+        return os.path.exists(self.file_path) or os.path.exists(self.journal_path)
+
+    def append(self, records: list[dict]):
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with open(self.journal_path, "ab") as f:
+            written = f.write(lines)
+        self.journal_records += len(records)
+        return written
+
+    def compact(self, snapshot: dict):
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        written = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self.file_path)
+        # records up to the snapshot's seq are skipped on replay, so a crash before truncation is harmless
+        open(self.journal_path, "w").close()
+        self.journal_records = 0
+        return written
+
+    def load(self):
+        snapshot = None
+        if os.path.exists(self.file_path):
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+
+        records = []
+        torn = False
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # a corrupt complete line is skipped; the records after it carry their own seq and still replay
+                        if line.endswith("\n"):
+                            print(f"Error reading {self.journal_path}: skipping a corrupt record")
+                        torn = True
+                    if not line.endswith("\n"):
+                        # a crash mid-append leaves a partial last line
+                        torn = True
+        self.journal_records = len(records)
+
+        # a torn or corrupt journal is folded into a fresh snapshot of every readable record, so new records are
+        # not appended after the damage
+        return snapshot, records, torn
+
+
+class SQLiteDatabase:
+    # one connection per database file shared by every session; commits are batched
+    def __init__(
+        self, path: str, commit_every: int = sqlite_commit_every, commit_interval: float = sqlite_commit_interval
+    ):
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.lock = threading.Lock()
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+        self.flush_timer = None
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(GAME_TURNS_SCHEMA)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(game_turns)")]
+        if "turn_no" in columns:
+            # tables created before the column was renamed
+            self.connection.execute("ALTER TABLE game_turns RENAME COLUMN turn_no TO seq")
+        self.connection.commit()
+        atexit.register(self.commit)
+
+    def insert(self, rows: list[tuple]):
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO game_turns (session_id, seq, kind, user_input, text) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.uncommitted += len(rows)
+            if self.uncommitted >= self.commit_every or time.monotonic() - self.last_commit >= self.commit_interval:
+                self._commit()
+            elif self.flush_timer is None:
+                # an idle server still commits its last turns once the interval has passed
+                self.flush_timer = threading.Timer(self.commit_interval, self.commit)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def select(self, query: str, params: tuple):
+        with self.lock:
+            return self.connection.execute(query, params).fetchall()
+
+    def commit(self):
+        with self.lock:
+            self._commit()
+
+    def _commit(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if self.uncommitted:
+            self.connection.commit()
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+
+
+databases = {}
+databases_lock = threading.Lock()
+
+
+def get_database(path: str) -> SQLiteDatabase:
+    with databases_lock:
+        if path not in databases:
+            databases[path] = SQLiteDatabase(path)
+        return databases[path]
+
+
+class SQLiteStore:
+    def __init__(self, session_id: str, path: str = db_path):
+        self.session_id = session_id
+        self.database = get_database(path)
+        self.journal_records = 0
+
+    def exists(self):
+        return bool(self.database.select("SELECT 1 FROM game_turns WHERE session_id = ? LIMIT 1", (self.session_id,)))
+
+    def append(self, records: list[dict]):
+        rows = [
+            (self.session_id, record["seq"], record["type"], record["user_input"], record["story"])
+            for record in records
+        ]
+        self.database.insert(rows)
+        # text payload only; sqlite's page overhead is not counted
+        return sum(len((user_input or "").encode("utf-8")) + len(text.encode("utf-8")) for *_, user_input, text in rows)
+
+    def compact(self, snapshot: dict):
+        # rows are already the compact form; resuming is a single range scan on the primary key
+        self.database.commit()
+        return 0
+
+    def load(self):
+        rows = self.database.select(
+            "SELECT seq, kind, user_input, text FROM game_turns WHERE session_id = ? ORDER BY seq",
+            (self.session_id,),
+        )
+        records = [
+            {"seq": seq, "type": kind, "user_input": user_input, "story": text} for seq, kind, user_input, text in rows
+        ]
+        return None, records, False
+
+
+def create_store(file_path: str, session_id: str):
+    if storage == "sqlite":
+        return SQLiteStore(session_id)
+    return JournalStore(file_path)
@@ -0,0 +1,93 @@
+import os
+import threading
+
+import numpy as np
+
+embedding_model = os.getenv("NARRATIUM_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+retrieval_k = int(os.getenv("NARRATIUM_RETRIEVAL_K", "0"))
+
+embedders = {}
+embedders_lock = threading.Lock()
+
+
+def get_embedder(model_name: str = embedding_model):
+    # one model per process, shared by every session; None if it cannot be loaded
+    with embedders_lock:
+        if model_name not in embedders:
+            embedders[model_name] = None
+            try:
+                # imported on first use so servers without retrieval never load torch
+                from sentence_transformers import SentenceTransformer
+
+                embedders[model_name] = SentenceTransformer(model_name)
+            except Exception as e:
+                print(f"Error loading embedding model {model_name}: {str(e)}")
+        return embedders[model_name]
+
+
+class EventIndex:
+    # row i holds the normalized embedding of history_story.story[i], appended to a raw float32 file and memory-mapped;
+    # the file is <history path>.vectors for every storage backend and is rebuilt from the events if it is removed
+    def __init__(self, file_path: str, embedder=None):
+        self.embedder = embedder or get_embedder()
+        self.dim = self.embedder.get_sentence_embedding_dimension()
+        self.path = file_path + ".vectors"
+        self.write_lock = threading.Lock()
+        self.count = 0
+        self.vectors = np.empty((0, self.dim), dtype=np.float32)
+
+        if os.path.exists(self.path):
+            row_bytes = self.dim * 4
+            size = os.path.getsize(self.path)
+            if size % row_bytes:
+                # a crash mid-append leaves a partial last row
+                with open(self.path, "r+b") as f:
+                    f.truncate(size - size % row_bytes)
+            self.count = size // row_bytes
+            self.remap()
+
+    def remap(self):
+        if self.count:
+            self.vectors = np.memmap(self.path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        else:
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return self.embedder.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+    def sync(self, events: list[str]):
+        # embeds whatever events are not indexed yet; safe to call repeatedly and from several threads
+        with self.write_lock:
+            if len(events) < self.count:
+                # the history was rewound (e.g. a lost journal tail); rebuild the stale rows
+                with open(self.path, "r+b") as f:
+                    f.truncate(len(events) * self.dim * 4)
+                self.count = len(events)
+                self.remap()
+            new_events = events[self.count :]
+            if not new_events:
+                return
+            vectors = self.embed(new_events)
+            with open(self.path, "ab") as f:
+                f.write(vectors.tobytes())
+            self.count += len(vectors)
+            self.remap()
+
+    def score(self, query: str) -> np.ndarray:
+        # cosine similarity of query against every indexed event as one matrix-vector product
+        vectors = self.vectors
+        if not len(vectors) or not query:
+            return np.empty(0, dtype=np.float32)
+        return vectors @ self.embed([query])[0]
+
+
+def top_k(scores: np.ndarray, limit: int, k: int = retrieval_k) -> list[int]:
+    # indices of the k best scores before limit, best first
+    scores = scores[:limit]
+    if not len(scores) or k <= 0:
+        return []
+    if k < len(scores):
+        top = np.argpartition(-scores, k)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top])].tolist()
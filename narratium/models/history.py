@@ -1,4 +1,13 @@
 import json
+import os
+import threading
+from collections import deque
+
+from narratium.db.store import create_store
+from narratium.utils.tokens import count_tokens, exact_counts
+
+journal_compact_every = int(os.getenv("NARRATIUM_JOURNAL_COMPACT_EVERY", "100"))
+summary_fanout = int(os.getenv("NARRATIUM_SUMMARY_FANOUT", "8"))
 
 
 class Story:
@@ -6,92 +15,235 @@ class Story:
         self.language = language
         self.user_input = user_input or []
         self.story = story or []
+        self.size = sum(len(text) for text in self.user_input) + sum(len(text) for text in self.story)
+        self.token_counts = [None] * len(self.story)
+        self.exact_counts = exact_counts()
+
+    def render(self, user_input: str, story: str):
+        if self.language == "zh":
+            return ("" if user_input == "" else f"你做出选择：{user_input}\n\n") + story + "\n\n"
+        elif self.language == "en":
+            return ("" if user_input == "" else f"You make a choice:{user_input}\n\n") + story + "\n\n"
+        return ""
 
     def add_story(self, user_input: str, story: str):
         self.user_input.append(user_input)
         self.story.append(story)
+        self.token_counts.append(None)
+        self.size += len(user_input or "") + len(story)
+
+    def entry(self, index: int):
+        # rendered on demand rather than kept next to the raw text; the context builder only renders its window
+        return self.render(self.user_input[index], self.story[index])
+
+    def entry_tokens(self, index: int):
+        if not self.exact_counts and exact_counts():
+            # the tokenizer finished loading after these were estimated
+            self.token_counts = [None] * len(self.story)
+            self.exact_counts = True
+        if self.token_counts[index] is None:
+            self.token_counts[index] = count_tokens(self.entry(index))
+        return self.token_counts[index]
 
     def get_story(self, start_index: int | None = None, end_index: int | None = None):
         if start_index is None:
             start_index = 0
         if end_index is None:
             end_index = len(self.story)
-        result = ""
-        if self.language == "zh":
-            for i in range(start_index, end_index):
-                result += (
-                    ("" if self.user_input[i] == "" else f"你做出选择：{self.user_input[i]}\n\n")
-                    + self.story[i]
-                    + "\n\n"
-                )
-        elif self.language == "en":
-            for i in range(start_index, end_index):
-                result += (
-                    ("" if self.user_input[i] == "" else f"You make a choice:{self.user_input[i]}\n\n")
-                    + self.story[i]
-                    + "\n\n"
-                )
-        return result
+        return "".join(self.entry(index) for index in range(start_index, end_index))
 
 
 class History:
-    def __init__(self, language: str, file_path: str = "history.json", mem_len: int = 10):
+    def __init__(
+        self,
+        language: str,
+        file_path: str = "history.json",
+        mem_len: int = 10,
+        compact_every: int = journal_compact_every,
+        session_id: str | None = None,
+        store=None,
+        summary_fanout: int = summary_fanout,
+    ):
         self.file_path = file_path
+        if session_id is None:
+            session_id = os.path.splitext(os.path.basename(file_path))[0].removeprefix("history_")
+        self.session_id = session_id
+        self.store = store or create_store(file_path, session_id)
+        self.compact_every = compact_every
+        self.seq = 0
+        self.unsaved = []
         self.mem_len = mem_len
         self.story_framework = ""
+        self.character_info = None
+        # model, language, type and speculation of an API session, so a dormant game resumes as it was created
+        self.session_config = None
         self.recent_story = Story(language)
         self.history_story = Story(language)
+        # summaries[0] folds every summary_fanout events into a chapter, summaries[1] folds chapters into arcs, ...
+        self.summary_fanout = summary_fanout
+        self.summaries = []
+        # ring buffer of the last mem_len rendered narratives
+        self.recent_window = deque(maxlen=mem_len)
+        self.recent_text = ""
+        # compressed events are recorded from a background worker while the next turn reads
+        self.lock = threading.RLock()
 
     def add_story(self, type: str, story: str, user_input: str | None = None):
-        if type == "story_framework":
-            self.story_framework = story
-        elif type == "recent":
-            self.recent_story.add_story(user_input, story)
-        elif type == "history":
-            self.history_story.add_story(user_input, story)
+        with self.lock:
+            self.apply(type, story, user_input)
+            self.seq += 1
+            self.unsaved.append({"seq": self.seq, "type": type, "story": story, "user_input": user_input})
+
+    def apply(self, type: str, story: str, user_input: str | None = None):
+        with self.lock:
+            if type == "story_framework":
+                self.story_framework = story
+            elif type == "character":
+                self.character_info = json.loads(story)
+            elif type == "session":
+                self.session_config = json.loads(story)
+            elif type == "recent":
+                self.recent_story.add_story(user_input, story)
+                self.recent_window.append(self.recent_story.entry(-1))
+                self.recent_text = None
+            elif type == "history":
+                self.history_story.add_story(user_input, story)
+            elif type == "summary":
+                # the level of a summary node is carried in the user_input column
+                level = int(user_input)
+                while len(self.summaries) < level:
+                    self.summaries.append(Story(self.history_story.language))
+                self.summaries[level - 1].add_story("", story)
 
     def get_story(self, type: str):
+        with self.lock:
+            return self._get_story(type)
+
+    def _get_story(self, type: str):
         if type == "story_framework":
             return self.story_framework
         elif type == "recent":
-            return self.recent_story.get_story(
-                start_index=len(self.recent_story.story) - self.mem_len
-                if len(self.recent_story.story) > self.mem_len
-                else 0,
-                end_index=len(self.recent_story.story),
-            )
-        elif type == "history":
-            return self.history_story.get_story(
-                start_index=0,
-                end_index=len(self.history_story.story) - self.mem_len
-                if len(self.history_story.story) > self.mem_len
-                else 0,
-            )
+            if self.recent_text is None:
+                self.recent_text = "".join(self.recent_window)
+            return self.recent_text
+
+    def size(self):
+        # approximate in-memory footprint in characters, used for session memory budgets
+        return (
+            len(self.story_framework)
+            + self.recent_story.size
+            + self.history_story.size
+            + sum(level.size for level in self.summaries)
+        )
+
+    def set_character(self, info: dict):
+        self.add_story("character", story=json.dumps(info, ensure_ascii=False), user_input="")
+
+    def set_session_config(self, config: dict):
+        self.add_story("session", story=json.dumps(config, ensure_ascii=False), user_input="")
+
+    def add_summary(self, level: int, summary: str):
+        self.add_story("summary", story=summary, user_input=str(level))
+
+    def next_summary(self):
+        # the lowest level with a full group of unsummarized children is folded first
+        with self.lock:
+            if self.summary_fanout < 2:
+                return None
+            children = self.history_story
+            level = 1
+            while True:
+                done = len(self.summaries[level - 1].story) if level <= len(self.summaries) else 0
+                if (done + 1) * self.summary_fanout <= len(children.story):
+                    start = done * self.summary_fanout
+                    return level, children.get_story(start, start + self.summary_fanout).strip()
+                if level > len(self.summaries):
+                    return None
+                children = self.summaries[level - 1]
+                level += 1
+
+    def summary_cover(self, end: int):
+        # fewest summary nodes covering events [0, covered), taken from the highest level down
+        with self.lock:
+            nodes = []
+            covered = 0
+            for level in range(len(self.summaries), 0, -1):
+                span = self.summary_fanout**level
+                summaries = self.summaries[level - 1]
+                while covered // span < len(summaries.story) and covered + span <= end:
+                    nodes.append((level, covered // span))
+                    covered += span
+            return nodes, covered
+
+    def exists(self):
+        return self.store.exists()
 
     def save_history(self):
-        with open(self.file_path, "w") as f:
-            json.dump(
+        # returns the bytes written, journal appends plus any compacted snapshot
+        written = 0
+        with self.lock:
+            if self.unsaved:
+                written += self.store.append(self.unsaved)
+                self.unsaved = []
+            if self.store.journal_records >= self.compact_every:
+                written += self.compact()
+        return written
+
+    def compact(self):
+        with self.lock:
+            return self.store.compact(
                 {
+                    "seq": self.seq,
                     "story_framework": self.story_framework,
+                    "character_info": self.character_info,
+                    "session_config": self.session_config,
                     "recent_story_user_input": self.recent_story.user_input,
                     "recent_story_story": self.recent_story.story,
                     "history_story_user_input": self.history_story.user_input,
                     "history_story_story": self.history_story.story,
-                },
-                f,
-                ensure_ascii=False,
+                    "summaries": [level.story for level in self.summaries],
+                }
             )
 
     def load_history(self):
-        try:
-            with open(self.file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                self.story_framework = data["story_framework"]
-                self.recent_story.user_input = data["recent_story_user_input"]
-                self.recent_story.story = data["recent_story_story"]
-                self.history_story.user_input = data["history_story_user_input"]
-                self.history_story.story = data["history_story_story"]
-        except Exception:
-            print("No history file found, creating new one")
-            return False
+        with self.lock:
+            if not self.exists():
+                print("No history file found, creating new one")
+                return False
+            try:
+                snapshot, records, needs_compaction = self.store.load()
+                if snapshot is not None:
+                    self.load_snapshot(snapshot)
+                for record in records:
+                    # records already folded into the snapshot are skipped
+                    if record["seq"] <= self.seq:
+                        continue
+                    self.apply(record["type"], record["story"], record["user_input"])
+                    self.seq = record["seq"]
+                if needs_compaction:
+                    self.compact()
+            except Exception:
+                print("Failed to load history file, creating new one")
+                return False
+            recent = self.recent_story
+            self.recent_window = deque(
+                (recent.entry(index) for index in range(max(0, len(recent.story) - self.mem_len), len(recent.story))),
+                maxlen=self.mem_len,
+            )
+            self.recent_text = None
         return True
+
+    def load_snapshot(self, data: dict):
+        self.seq = data.get("seq", 0)
+        self.story_framework = data["story_framework"]
+        self.character_info = data.get("character_info")
+        self.session_config = data.get("session_config")
+        self.recent_story = Story(
+            self.recent_story.language, data["recent_story_user_input"], data["recent_story_story"]
+        )
+        self.history_story = Story(
+            self.history_story.language, data["history_story_user_input"], data["history_story_story"]
+        )
+        self.summaries = [
+            Story(self.history_story.language, [""] * len(level), level) for level in data.get("summaries", [])
+        ]
@@ -1,58 +1,85 @@
+from narratium.prompts.templates import compile_template
+
+PROMPT_NAMES = (
+    "character_easy",
+    "character_complex",
+    "embedded_story",
+    "stable_story",
+    "action_instructions",
+    "setting",
+    "text_adventure",
+    "story_compressor",
+    "story_rollup",
+    "world",
+    "structured",
+)
+PROMPT_LANGUAGES = ("en", "zh")
+
+
 class SystemPrompts:
     def __init__(self, language="en"):
         self.language = language
+        self.template_language = "en" if language == "en" else "zh"
+
+    def template(self, name):
+        return prompt_templates[(name, self.template_language)]
+
+    def render(self, name, **values):
+        return self.template(name).render(**values)
 
     def get_character_easy_prompt(self, character_info):
-        if self.language == "en":
-            return get_character_easy_prompt_en(character_info)
-        else:
-            return get_character_easy_prompt_zh(character_info)
+        return self.render("character_easy", character_info=character_info)
 
     def get_character_complex_prompt(self, character_info):
-        if self.language == "en":
-            return get_character_complex_prompt_en(character_info)
-        else:
-            return get_character_complex_prompt_zh(character_info)
-
-    def get_embedded_story_prompt(self, story_framework, character_info, history_story, recent_story, user_input):
-        if self.language == "en":
-            return get_embedded_story_prompt_en(
-                story_framework, character_info, history_story, recent_story, user_input
-            )
-        else:
-            return get_embedded_story_prompt_zh(
-                story_framework, character_info, history_story, recent_story, user_input
-            )
+        return self.render("character_complex", character_info=character_info)
+
+    def get_embedded_story_prompt(
+        self, story_framework, character_info, history_story, recalled_story, recent_story, user_input
+    ):
+        return self.render(
+            "embedded_story",
+            story_framework=story_framework,
+            character_info=character_info,
+            history_story=history_story,
+            recalled_story=recalled_story,
+            recent_story=recent_story,
+            user_input=user_input,
+        )
+
+    def get_stable_story_prompt(
+        self, story_framework, character_info, history_story, recalled_story, recent_story, user_input
+    ):
+        # per-turn data only, ordered from most to least stable; the instructions move to the system message
+        return self.render(
+            "stable_story",
+            story_framework=story_framework,
+            character_info=character_info,
+            history_story=history_story,
+            recalled_story=recalled_story,
+            recent_story=recent_story,
+            user_input=user_input,
+        )
+
+    def get_action_instructions_prompt(self):
+        return self.render("action_instructions")
 
     def get_setting_prompt(self, story_framework, character_info):
-        if self.language == "en":
-            return get_setting_prompt_en(story_framework, character_info)
-        else:
-            return get_setting_prompt_zh(story_framework, character_info)
+        return self.render("setting", story_framework=story_framework, character_info=character_info)
 
     def get_text_adventure_prompt(self):
-        if self.language == "en":
-            return get_text_adventure_prompt_en()
-        else:
-            return get_text_adventure_prompt_zh()
+        return self.render("text_adventure")
 
     def get_story_compressor_prompt(self, user_input, story):
-        if self.language == "en":
-            return get_story_compressor_prompt_en(user_input, story)
-        else:
-            return get_story_compressor_prompt_zh(user_input, story)
+        return self.render("story_compressor", user_input=user_input, story=story)
+
+    def get_story_rollup_prompt(self, events):
+        return self.render("story_rollup", events=events)
 
     def get_world_prompt(self):
-        if self.language == "en":
-            return get_world_prompt_en()
-        else:
-            return get_world_prompt_zh()
+        return self.render("world")
 
     def get_structured_prompt(self, story_framework, character_info):
-        if self.language == "en":
-            return get_structured_prompt_en(story_framework, character_info)
-        else:
-            return get_structured_prompt_zh(story_framework, character_info)
+        return self.render("structured", story_framework=story_framework, character_info=character_info)
 
 
 def get_character_easy_prompt_en(character_info):
@@ -175,7 +202,21 @@ def get_character_complex_prompt_en(character_info):
     return prompt
 
 
-def get_embedded_story_prompt_en(story_framework, character_info, history_story, recent_story, user_input):
+def get_embedded_story_prompt_en(
+    story_framework, character_info, history_story, recalled_story, recent_story, user_input
+):
+    # the turn's data followed by the shared action instructions, in one message
+    return (
+        get_stable_story_prompt_en(
+            story_framework, character_info, history_story, recalled_story, recent_story, user_input
+        )
+        + get_action_instructions_prompt_en()
+    )
+
+
+def get_stable_story_prompt_en(
+    story_framework, character_info, history_story, recalled_story, recent_story, user_input
+):
     prompt = f"""
     You get the following information:
 
@@ -194,6 +235,11 @@ def get_embedded_story_prompt_en(story_framework, character_info, history_story,
     {history_story}
     </history_story>
 
+    Recalled Story is earlier events related to the user input, brought back from further in the past.
+    <recalled_story>
+    {recalled_story}
+    </recalled_story>
+
     Recent Story is the most recent part of the story.
     <recent_story>
     {recent_story}
@@ -203,7 +249,12 @@ def get_embedded_story_prompt_en(story_framework, character_info, history_story,
     <user_input>
     {user_input}
     </user_input>
+    """
+    return prompt
+
 
+def get_action_instructions_prompt_en():
+    prompt = """
     Continue the story by PRIMARILY responding to the user_input. Follow these steps:
     1. Analyze the user's action intent from their input
     2. Determine consequences based on the story framework、history_story and recent_story
@@ -320,6 +371,34 @@ def get_story_compressor_prompt_en(user_input, story):
     return prompt
 
 
+def get_story_rollup_prompt_en(events):
+    prompt = f"""
+    You are a story summarizer. The events below are consecutive, already compressed parts of one story, in order.
+    Fold them into a single chapter summary that a storyteller can rely on to continue the story.
+
+    <events>
+    {events}
+    </events>
+
+    1. Keep:
+        - Main plot points and turning points
+        - The protagonist's key decisions and their consequences
+        - Characters, places and items that may matter later
+        - Unresolved conflicts and open threads
+
+    2. Drop:
+        - Details that had no lasting effect
+        - Repetition across events
+
+    Return the summary in this format:
+
+    <event>
+    [A short paragraph of simple, direct sentences in chronological order]
+    </event>
+    """
+    return prompt
+
+
 def get_world_prompt_en():
     prompt = """
     You are a professional world framework generator, needed to create a rich, logical, and clearly related game world knowledge library, similar to a Wikipedia.
@@ -606,7 +685,21 @@ def get_character_complex_prompt_zh(character_info):
     return prompt
 
 
-def get_embedded_story_prompt_zh(story_framework, character_info, history_story, recent_story, user_input):
+def get_embedded_story_prompt_zh(
+    story_framework, character_info, history_story, recalled_story, recent_story, user_input
+):
+    # the turn's data followed by the shared action instructions, in one message
+    return (
+        get_stable_story_prompt_zh(
+            story_framework, character_info, history_story, recalled_story, recent_story, user_input
+        )
+        + get_action_instructions_prompt_zh()
+    )
+
+
+def get_stable_story_prompt_zh(
+    story_framework, character_info, history_story, recalled_story, recent_story, user_input
+):
     prompt = f"""
     你获得以下信息：
 
@@ -625,16 +718,26 @@ def get_embedded_story_prompt_zh(story_framework, character_info, history_story,
     {history_story}
     </history_story>
 
-    4. 故事的最新部分
+    4. 与当前输入相关的较早事件，从故事更早的部分召回
+    <recalled_story>
+    {recalled_story}
+    </recalled_story>
+
+    5. 故事的最新部分
     <recent_story>
     {recent_story}
     </recent_story>
 
-    5. 当前用户输入或指令
+    6. 当前用户输入或指令
     <user_input>
     {user_input}
     </user_input>
+    """
+    return prompt
 
+
+def get_action_instructions_prompt_zh():
+    prompt = """
     【思维链路过程】
     我将通过以下步骤分析情境并构建合适的故事回应：
 
@@ -855,6 +958,34 @@ def get_story_compressor_prompt_zh(user_input, story):
     return prompt
 
 
+def get_story_rollup_prompt_zh(events):
+    prompt = f"""
+    你是一个故事总结器。下面的事件是同一个故事中按顺序排列、已经压缩过的连续片段。
+    请将它们合并为一段章节摘要，供讲述者继续故事时参考。
+
+    <events>
+    {events}
+    </events>
+
+    1. 保留：
+       - 主要情节点和关键转折
+       - 主角的关键决策及其后果
+       - 之后可能再次出现的人物、地点和物品
+       - 尚未解决的冲突和伏笔
+
+    2. 删除：
+       - 没有持续影响的细节
+       - 事件之间的重复内容
+
+    请按照以下格式返回摘要：
+
+    <event>
+    [按时间顺序，用简洁直接的句子写成的一段话]
+    </event>
+    """
+    return prompt
+
+
 def get_world_prompt_zh():
     prompt = """
     你是一个专业的世界框架生成器，需要创建一个内容丰富、逻辑连贯且关系明确的游戏世界知识库，形式类似于维基百科。作为一个世界构建专家，你需要：
@@ -1005,3 +1136,11 @@ def get_structured_prompt_zh(story_framework, character_info):
     - 留下一些有意的空白和谜团，为未来故事发展预留空间
     """
     return prompt
+
+
+# every (prompt, language) template is compiled and validated once, when this module is first imported
+prompt_templates = {
+    (name, language): compile_template(name, language, globals()[f"get_{name}_prompt_{language}"])
+    for name in PROMPT_NAMES
+    for language in PROMPT_LANGUAGES
+}
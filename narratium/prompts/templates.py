@@ -0,0 +1,89 @@
+import hashlib
+import inspect
+import re
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+SLOT_PATTERN = re.compile("\x00(\\w+)\x00")
+MESSAGE_TYPES = {"system": SystemMessage, "human": HumanMessage, "ai": AIMessage}
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class PromptTemplate:
+    # literal segments around variable slots: segments[i] precedes slots[i], the last segment trails
+    def __init__(self, name: str, language: str, segments: tuple[str, ...], slots: tuple[str, ...]):
+        self.name = name
+        self.language = language
+        self.segments = segments
+        self.slots = slots
+        self.variables = tuple(dict.fromkeys(slots))
+        self.hash = content_hash(*segments, *slots)
+
+    def render(self, **values) -> str:
+        parts = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            parts.append(values[slot])
+            parts.append(segment)
+        return "".join(parts)
+
+    def __repr__(self):
+        return f"PromptTemplate({self.name}/{self.language}, variables={self.variables}, hash={self.hash})"
+
+
+def compile_template(name: str, language: str, prompt_fn) -> PromptTemplate:
+    # renders the prompt function once with a marker per parameter and splits on the markers
+    variables = list(inspect.signature(prompt_fn).parameters)
+    text = prompt_fn(*(f"\x00{variable}\x00" for variable in variables))
+    parts = SLOT_PATTERN.split(text)
+    segments, slots = tuple(parts[::2]), tuple(parts[1::2])
+
+    unknown = set(slots) - set(variables)
+    unused = set(variables) - set(slots)
+    if unknown or unused or any("\x00" in segment for segment in segments):
+        raise ValueError(
+            f"Invalid prompt template {name}/{language}: unknown {unknown or '{}'}, unused {unused or '{}'}"
+        )
+    return PromptTemplate(name, language, segments, slots)
+
+
+class ChatTemplate:
+    # a list of (role, template) messages; constant messages are rendered once up front
+    def __init__(self, messages: list[tuple[str, PromptTemplate | str]]):
+        self.messages = [
+            (
+                MESSAGE_TYPES[role],
+                template.render() if isinstance(template, PromptTemplate) and not template.slots else template,
+            )
+            for role, template in messages
+        ]
+        self.variables = tuple(
+            dict.fromkeys(
+                variable
+                for _, template in self.messages
+                if isinstance(template, PromptTemplate)
+                for variable in template.variables
+            )
+        )
+        self.hash = content_hash(
+            *(
+                f"{message_type.__name__}:{template.hash if isinstance(template, PromptTemplate) else content_hash(template)}"
+                for message_type, template in self.messages
+            )
+        )
+
+    def format_messages(self, **values) -> list:
+        return [
+            message_type(content=template.render(**values) if isinstance(template, PromptTemplate) else template)
+            for message_type, template in self.messages
+        ]
+
+    def format(self, inputs: dict) -> list:
+        # LCEL step: the mapping produced by the previous step in, chat messages out
+        return self.format_messages(**inputs)
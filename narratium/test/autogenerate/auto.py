@@ -1,10 +1,11 @@
 import os
 import sys
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
 
-from game import TextAdventureGame
+from narratium.core.game import TextAdventureGame
 
 if __name__ == "__main__":
+    # python narratium/test/autogenerate/auto.py [openai|ollama|stub]
     game = TextAdventureGame(auto_test=True)
-    game.start_game()
+    game.start_game(type=sys.argv[1] if len(sys.argv) > 1 else "openai")
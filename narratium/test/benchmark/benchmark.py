@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+# Add repository root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+STORY_FRAMEWORK = "A quiet river town where people have started disappearing at night."
+CHARACTER_INFO = "A young locksmith looking for a missing sister."
+OPENING_ACTIONS = ["Look around", "Ask the innkeeper about the disappearances", "Walk down to the river"]
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (the peak where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+def percentiles(values: list) -> dict:
+    """p50/p95/p99 and max of a list of seconds, rounded to milliseconds."""
+    if not values:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "p50": round(float(p50), 4),
+        "p95": round(float(p95), 4),
+        "p99": round(float(p99), 4),
+        "max": round(float(max(values)), 4),
+    }
+
+
+class Player:
+    """
+    Simulated player: sets up a game and then plays like auto_test mode, picking a random suggested prompt each turn.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, index: int, args):
+        self.client = client
+        self.index = index
+        self.args = args
+        self.rng = random.Random(args.seed + index)
+        self.game_id = None
+        self.setup_latency = None
+        self.first_chunk = []
+        self.turn_latency = []
+        self.chunks = 0
+        self.errors = []
+
+    async def setup(self):
+        response = await self.client.post(
+            "/initialize",
+            json={"model": self.args.model, "type": self.args.type, "language": self.args.language},
+        )
+        response.raise_for_status()
+        self.game_id = response.json()["game_id"]
+
+        start = time.perf_counter()
+        response = await self.client.post(
+            "/setup",
+            json={"game_id": self.game_id, "story_framework": STORY_FRAMEWORK, "character_info": CHARACTER_INFO},
+        )
+        response.raise_for_status()
+        result = response.json()
+        if not result["success"]:
+            raise RuntimeError(result.get("message") or "setup failed")
+        self.setup_latency = time.perf_counter() - start
+        return result["next_prompts"] or OPENING_ACTIONS
+
+    async def stream_turn(self, user_input: str):
+        # time to first narrative chunk and to the complete line of one /action/stream turn
+        start = time.perf_counter()
+        first_chunk = None
+        next_prompts = []
+        async with self.client.stream(
+            "POST", "/action/stream", json={"game_id": self.game_id, "user_input": user_input}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "chunk":
+                    self.chunks += 1
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter() - start
+                elif event["type"] == "complete":
+                    next_prompts = event["next_prompts"]
+                elif event["type"] == "error":
+                    raise RuntimeError(event["message"])
+        latency = time.perf_counter() - start
+        self.first_chunk.append(first_chunk if first_chunk is not None else latency)
+        self.turn_latency.append(latency)
+        return next_prompts
+
+    async def turn(self, user_input: str):
+        start = time.perf_counter()
+        response = await self.client.post("/action", json={"game_id": self.game_id, "user_input": user_input})
+        response.raise_for_status()
+        result = response.json()
+        if not result["success"]:
+            raise RuntimeError(result.get("message") or "action failed")
+        latency = time.perf_counter() - start
+        # without streaming the first byte is the whole turn
+        self.first_chunk.append(latency)
+        self.turn_latency.append(latency)
+        return result["next_prompts"]
+
+    async def play(self):
+        try:
+            prompts = await self.setup()
+        except Exception as e:
+            self.errors.append(f"setup: {str(e)}")
+            return
+        for _ in range(self.args.turns):
+            if self.args.think_time:
+                await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+            user_input = self.rng.choice(prompts or OPENING_ACTIONS)
+            try:
+                if self.args.stream:
+                    prompts = await self.stream_turn(user_input)
+                else:
+                    prompts = await self.turn(user_input)
+            except Exception as e:
+                self.errors.append(f"turn: {str(e)}")
+
+
+async def run_benchmark(args, client: httpx.AsyncClient) -> dict:
+    """
+    Run args.players simulated players against one client and aggregate their latencies.
+
+    Args:
+        args: Parsed command line arguments
+        client: Client bound to the app in-process or to a server URL
+
+    Returns:
+        Dictionary with latency percentiles, throughput and memory figures
+    """
+    rss_before = current_rss()
+    players = [Player(client, index, args) for index in range(args.players)]
+    start = time.perf_counter()
+    await asyncio.gather(*(player.play() for player in players))
+    elapsed = time.perf_counter() - start
+
+    response = await client.get("/sessions/stats")
+    session_stats = response.json() if response.status_code == 200 else {}
+    live = session_stats.get("live") or 0
+    turns = sum(len(player.turn_latency) for player in players)
+
+    results = {
+        "config": {
+            "players": args.players,
+            "turns": args.turns,
+            "stream": args.stream,
+            "target": args.url or "in-process",
+            "type": args.type,
+            "tokens_per_second": args.tokens_per_second if not args.url else None,
+            "first_token_delay": args.first_token_delay if not args.url else None,
+            "think_time": args.think_time,
+            "seed": args.seed,
+        },
+        "elapsed": round(elapsed, 3),
+        "turns": turns,
+        "errors": sum(len(player.errors) for player in players),
+        "error_samples": [error for player in players for error in player.errors][:5],
+        "throughput": {
+            "turns_per_second": round(turns / elapsed, 2) if elapsed else 0,
+            "chunks_per_second": round(sum(player.chunks for player in players) / elapsed, 2) if elapsed else 0,
+        },
+        "setup_latency": percentiles([player.setup_latency for player in players if player.setup_latency is not None]),
+        "first_chunk_latency": percentiles([value for player in players for value in player.first_chunk]),
+        "turn_latency": percentiles([value for player in players for value in player.turn_latency]),
+        "memory": {
+            "history_bytes_per_session": session_stats.get("history_bytes", 0) // live if live else None,
+        },
+        "scheduler": (await client.get("/scheduler/stats")).json(),
+    }
+    if not args.url:
+        # only meaningful when the sessions live in this process
+        results["memory"]["rss_bytes_per_session"] = (current_rss() - rss_before) // max(1, args.players)
+        results["memory"]["peak_rss_bytes"] = peak_rss()
+    return results
+
+
+async def benchmark(args) -> dict:
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            return await run_benchmark(args, client)
+
+    # the stub reads its rate when imported, so configure it before loading the app
+    os.environ["NARRATIUM_STUB_TOKENS_PER_SECOND"] = str(args.tokens_per_second)
+    os.environ["NARRATIUM_STUB_FIRST_TOKEN_DELAY"] = str(args.first_token_delay)
+    from narratium.api.api import app, sessions
+
+    import uvicorn
+
+    # session histories are written to the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="narratium-benchmark-") as workdir:
+        os.chdir(workdir)
+        # served over a real socket on this event loop: httpx's ASGI transport buffers streamed responses,
+        # which would hide the time to first chunk
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="off"))
+        serving = asyncio.create_task(server.serve())
+        try:
+            while not server.started:
+                if serving.done():
+                    serving.result()
+                await asyncio.sleep(0.05)
+            port = server.servers[0].sockets[0].getsockname()[1]
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout) as client:
+                return await run_benchmark(args, client)
+        finally:
+            await sessions.close_all()
+            server.should_exit = True
+            await serving
+            os.chdir(cwd)
+
+
+def print_results(results: dict):
+    config = results["config"]
+    print(f"\n{config['players']} players x {config['turns']} turns against {config['target']} ({config['type']})")
+    print(f"Elapsed: {results['elapsed']:.2f}s, turns: {results['turns']}, errors: {results['errors']}")
+    print(
+        f"Throughput: {results['throughput']['turns_per_second']} turns/s, "
+        f"{results['throughput']['chunks_per_second']} chunks/s"
+    )
+    for name in ("setup_latency", "first_chunk_latency", "turn_latency"):
+        stats = results[name]
+        if stats["count"]:
+            print(f"{name:>20}: p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s  p99 {stats['p99']:.3f}s")
+    for name, value in results["memory"].items():
+        if value is not None:
+            print(f"{name:>28}: {value / 1024:.1f} KiB")
+    for error in results["error_samples"]:
+        print(f"Error: {error}")
+
+
+def main():
+    """Parse command line arguments and run the benchmark"""
+    parser = argparse.ArgumentParser(description="Latency and throughput benchmark with simulated players")
+    parser.add_argument("--players", "-p", type=int, default=20, help="Number of concurrent simulated players")
+    parser.add_argument("--turns", "-t", type=int, default=10, help="Turns played by each player after setup")
+    parser.add_argument("--url", "-u", type=str, default=None, help="Server URL; the app runs in-process if omitted")
+    parser.add_argument("--type", type=str, default="stub", help="LLM type passed to /initialize (default: stub)")
+    parser.add_argument("--model", "-m", type=str, default="stub", help="Model passed to /initialize")
+    parser.add_argument("--language", "-l", type=str, default="en", help="Game language (en or zh)")
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=100, help="Stub output rate, in-process only (default: 100)"
+    )
+    parser.add_argument(
+        "--first-token-delay", type=float, default=0.2, help="Stub delay before the first token, in-process only"
+    )
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="Use /action instead of streaming")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a player's turns (seconds)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the players' action choices")
+    parser.add_argument("--timeout", type=float, default=300, help="HTTP timeout per request (seconds)")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Optional file to save results (JSON)")
+
+    args = parser.parse_args()
+    results = asyncio.run(benchmark(args))
+    print_results(results)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
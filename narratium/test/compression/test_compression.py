@@ -1,8 +1,13 @@
 import argparse
+import gc
+import hashlib
 import json
+import multiprocessing
 import os
+import resource
 import sys
 import time
+from collections import OrderedDict
 from typing import Tuple
 
 import numpy as np
@@ -23,11 +28,18 @@ class HuggingFaceCompressor:
         print(f"Loading model: {model_name}...")
         self.model_name = model_name
 
-        # Load model with lower precision to save memory
+        # Load model with lower precision to save memory; CPUs lack fast float16 kernels
         try:
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+            # batched generation pads prompts on the left so every output starts right after its prompt
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
+            self.tokenizer.padding_side = "left"
             self.model = AutoModelForCausalLM.from_pretrained(
-                model_name, torch_dtype=torch.float16, low_cpu_mem_usage=True, device_map="auto"
+                model_name,
+                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+                low_cpu_mem_usage=True,
+                device_map="auto",
             )
 
             # Create generation pipeline
@@ -45,19 +57,9 @@ class HuggingFaceCompressor:
             print(f"Error loading model {model_name}: {e}")
             raise
 
-    def compress(self, user_input: str, story: str) -> str:
-        """
-        Compress a story using the loaded model.
-
-        Args:
-            user_input: User input associated with the story
-            story: Story text to compress
-
-        Returns:
-            Compressed version of the story
-        """
-        # Create compression prompt
-        prompt = f"""
+    @staticmethod
+    def build_prompt(user_input: str, story: str) -> str:
+        return f"""
         Please compress the following story while preserving key events, characters, and plot points.
         Make it shorter but keep all important information.
         
@@ -69,31 +71,105 @@ class HuggingFaceCompressor:
         Compressed story:
         """
 
-        try:
-            # Generate compressed story
-            outputs = self.pipe(prompt, return_full_text=False)
-            compressed_text = outputs[0]["generated_text"]
+    def compress_batch(self, items: list, batch_size: int = 4) -> list:
+        """
+        Compress several stories with one pass through the generation pipeline.
+
+        Args:
+            items: List of (user_input, story) tuples
+            batch_size: Prompts generated together
 
-            # Clean up response
-            compressed_text = compressed_text.strip()
+        Returns:
+            List of (compressed_text, generated_tokens) tuples, in the order of items
+        """
+        prompts = [self.build_prompt(user_input, story) for user_input, story in items]
+        outputs = self.pipe(prompts, batch_size=batch_size, return_full_text=False)
+        results = []
+        for output in outputs:
+            compressed_text = output[0]["generated_text"].strip()
+            results.append((compressed_text, len(self.tokenizer.encode(compressed_text, add_special_tokens=False))))
+        return results
+
+    def compress(self, user_input: str, story: str) -> str:
+        """
+        Compress a story using the loaded model.
+
+        Args:
+            user_input: User input associated with the story
+            story: Story text to compress
 
-            return compressed_text
+        Returns:
+            Compressed version of the story
+        """
+        try:
+            return self.compress_batch([(user_input, story)], batch_size=1)[0][0]
         except Exception as e:
             print(f"Error compressing story: {e}")
             return story
 
 
+class ModelCache:
+    """
+    Keeps up to max_size loaded models, evicting the least recently used one.
+    """
+
+    def __init__(self, max_size: int = 1):
+        self.max_size = max(1, max_size)
+        self.models = OrderedDict()
+
+    def get(self, name: str, factory):
+        """
+        Return the cached model for name, loading it with factory on a miss.
+
+        Args:
+            name: Model name used as the cache key
+            factory: Callable that loads the model
+
+        Returns:
+            Tuple of (model, load_time); load_time is 0 for a cache hit
+        """
+        if name in self.models:
+            self.models.move_to_end(name)
+            return self.models[name], 0.0
+
+        # free the evicted models before loading, so peak memory holds at most max_size of them
+        while len(self.models) >= self.max_size:
+            self.models.popitem(last=False)
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+        start_time = time.time()
+        self.models[name] = factory()
+        return self.models[name], time.time() - start_time
+
+
+# models stay loaded across runs in one process; pool workers each get their own caches
+compressor_cache = ModelCache(1)
+evaluator_cache = ModelCache(1)
+
+
 class EmbeddingEvaluator:
     """
     Evaluates story compression using local embedding models.
+
+    Texts are encoded in batches and original stories are cached on disk by content hash, so a benchmark run
+    encodes each original once and every candidate in a single call.
     """
 
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        batch_size: int = 32,
+        cache_dir: str = "test/compression/results/embeddings",
+    ):
         """
         Initialize with a small sentence transformer model.
 
         Args:
             model_name: HuggingFace model name for embeddings
+            batch_size: Number of texts the model encodes per forward pass
+            cache_dir: Directory for cached original-story embeddings (empty to disable)
         """
         print(f"Loading embedding model: {model_name}...")
         try:
@@ -104,6 +180,33 @@ class EmbeddingEvaluator:
             print(f"Error loading embedding model: {e}")
             raise
 
+        self.batch_size = batch_size
+        self.cache_path = os.path.join(cache_dir, model_name.replace("/", "_") + ".npz") if cache_dir else None
+        self.cache = {}
+        if self.cache_path and os.path.exists(self.cache_path):
+            with np.load(self.cache_path) as cached:
+                self.cache = {key: cached[key] for key in cached.files}
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def encode(self, texts: list) -> np.ndarray:
+        """
+        Encode texts in one call; rows are L2-normalized.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Matrix with one embedding per text
+        """
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return self.model.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32)
+
     def get_embedding(self, text: str) -> np.ndarray:
         """
         Get embedding vector for text using the local model.
@@ -112,43 +215,85 @@ class EmbeddingEvaluator:
             text: Text to embed
 
         Returns:
-            Embedding vector as numpy array
+            Normalized embedding vector as numpy array
         """
-        try:
-            # Get embedding from model
-            embedding = self.model.encode(text, normalize_embeddings=True)
-            return embedding
-
-        except Exception as e:
-            print(f"Error getting embedding: {e}")
-            # Return empty embedding in case of error
-            return np.zeros(384)
+        return self.encode([text])[0]
 
     def cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
         """
-        Calculate cosine similarity between two vectors.
+        Calculate cosine similarity between two normalized vectors.
 
         Args:
             vec1: First vector
             vec2: Second vector
 
         Returns:
-            Cosine similarity score (0-1)
+            Cosine similarity score (-1 to 1)
         """
-        # Ensure vectors are normalized
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
+        return float(np.clip(np.dot(vec1, vec2), -1.0, 1.0))
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp.npz"
+        np.savez(tmp_path, **self.cache)
+        os.replace(tmp_path, self.cache_path)
 
-        if norm1 > 0:
-            vec1 = vec1 / norm1
-        if norm2 > 0:
-            vec2 = vec2 / norm2
+    def evaluate_batch(self, pairs: list) -> list:
+        """
+        Evaluate many (original, compressed) pairs with a single encode call.
 
-        # Calculate dot product
-        dot_product = np.dot(vec1, vec2)
+        Originals found in the cache are not encoded again; uncached originals and all compressed texts are
+        encoded together, and similarities are computed as one vectorized product.
 
-        # Clip to [-1, 1] range to handle floating point errors
-        return float(np.clip(dot_product, -1.0, 1.0))
+        Args:
+            pairs: List of (original, compressed) text tuples
+
+        Returns:
+            List of evaluation dictionaries, in the order of pairs
+        """
+        if not pairs:
+            return []
+
+        start_time = time.time()
+        original_keys = [self.content_hash(original) for original, _ in pairs]
+        missing = {}
+        for key, (original, _) in zip(original_keys, pairs):
+            if key not in self.cache:
+                missing.setdefault(key, original)
+
+        embeddings = self.encode(list(missing.values()) + [compressed for _, compressed in pairs])
+        if missing:
+            self.cache.update(zip(missing, embeddings[: len(missing)]))
+            self.save_cache()
+        originals = np.stack([self.cache[key] for key in original_keys])
+        candidates = embeddings[len(missing) :]
+        similarities = np.clip(np.einsum("ij,ij->i", originals, candidates), -1.0, 1.0)
+        # encoding is shared by the whole batch, so each pair reports its share
+        embedding_time = (time.time() - start_time) / len(pairs)
+
+        results = []
+        for (original, compressed), semantic_similarity in zip(pairs, similarities.tolist()):
+            original_length = len(original)
+            compressed_length = len(compressed)
+            compression_ratio = compressed_length / original_length if original_length > 0 else 1.0
+
+            # Calculate overall quality score - balance between compression and similarity
+            # Higher is better: we want high similarity and low compression ratio
+            quality_score = semantic_similarity * (1 - compression_ratio)
+
+            results.append(
+                {
+                    "original_length": original_length,
+                    "compressed_length": compressed_length,
+                    "compression_ratio": compression_ratio,
+                    "semantic_similarity": semantic_similarity,
+                    "quality_score": quality_score,
+                    "embedding_time": embedding_time,
+                }
+            )
+        return results
 
     def evaluate_compression(self, original: str, compressed: str) -> dict:
         """
@@ -161,37 +306,14 @@ class EmbeddingEvaluator:
         Returns:
             Dictionary with evaluation metrics
         """
-        # Basic metrics
-        original_length = len(original)
-        compressed_length = len(compressed)
-        compression_ratio = compressed_length / original_length if original_length > 0 else 1.0
-
-        # Get embeddings for both texts
-        start_time = time.time()
-        original_embedding = self.get_embedding(original)
-        compressed_embedding = self.get_embedding(compressed)
-        embedding_time = time.time() - start_time
-
-        # Calculate semantic similarity
-        semantic_similarity = self.cosine_similarity(original_embedding, compressed_embedding)
-
-        # Calculate overall quality score - balance between compression and similarity
-        # Higher is better: we want high similarity and low compression ratio
-        quality_score = semantic_similarity * (1 - compression_ratio)
-
-        return {
-            "original_length": original_length,
-            "compressed_length": compressed_length,
-            "compression_ratio": compression_ratio,
-            "semantic_similarity": semantic_similarity,
-            "quality_score": quality_score,
-            "embedding_time": embedding_time,
-        }
+        return self.evaluate_batch([(original, compressed)])[0]
 
 
 class StoryDataset:
     """Provides test stories for compression benchmarking"""
 
+    story_ids = ("village_baker", "time_traveler", "family_winery", "cave_adventure")
+
     @staticmethod
     def get_story(story_id: str = "village_baker") -> Tuple[str, str]:
         """
@@ -277,83 +399,167 @@ class StoryDataset:
         return stories[story_id]
 
 
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def init_worker(threads: int):
+    """Split the CPU cores between pool workers instead of letting each one claim all of them."""
+    torch.set_num_threads(threads)
+
+
+def compress_stories(model_name: str, stories: dict, batch_size: int) -> dict:
+    """
+    Compress every story with one model, loading it through the model cache.
+
+    Runs in the calling process or in a pool worker, so it only returns plain data.
+
+    Args:
+        model_name: HuggingFace model to use for compression
+        stories: Mapping of story ID to (story_text, user_input)
+        batch_size: Prompts generated together
+
+    Returns:
+        Dictionary with compressions, timings, tokens/sec and peak RSS for the model
+    """
+    print(f"\nTesting model: {model_name}")
+    try:
+        compressor, load_time = compressor_cache.get(model_name, lambda: HuggingFaceCompressor(model_name))
+        start_time = time.time()
+        outputs = compressor.compress_batch(
+            [(user_input, story) for story, user_input in stories.values()], batch_size=batch_size
+        )
+        compression_time = time.time() - start_time
+    except Exception as e:
+        print(f"  Error testing model {model_name}: {e}")
+        return {"model": model_name, "error": str(e), "peak_rss_bytes": peak_rss()}
+
+    generated_tokens = sum(tokens for _, tokens in outputs)
+    print(f"  Time taken: {compression_time:.2f} seconds for {len(stories)} stories")
+    return {
+        "model": model_name,
+        "load_time": load_time,
+        "compression_time": compression_time,
+        "generated_tokens": generated_tokens,
+        "tokens_per_second": generated_tokens / compression_time if compression_time > 0 else 0.0,
+        "peak_rss_bytes": peak_rss(),
+        "compressions": {
+            story_id: {"compressed_text": compressed, "generated_tokens": tokens}
+            for story_id, (compressed, tokens) in zip(stories, outputs)
+        },
+    }
+
+
 def benchmark_huggingface_models(
-    story: str,
-    user_input: str,
+    stories: dict,
     models: list = ["TinyLlama/TinyLlama-1.1B-Chat-v1.0", "microsoft/phi-2", "EleutherAI/pythia-410m"],
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
     output_file: str = None,
+    batch_size: int = 32,
+    cache_dir: str = "test/compression/results/embeddings",
+    generation_batch_size: int = 4,
+    workers: int = 0,
 ):
     """
-    Benchmark different HuggingFace models for story compression.
+    Benchmark different HuggingFace models for story compression over a (model x story) matrix.
+
+    Each model compresses all stories in batched generation calls, either in this process or spread across a
+    process pool. The outputs of the whole matrix are then evaluated in one batched embedding pass.
 
     Args:
-        story: Original story to compress
-        user_input: User input related to the story
+        stories: Mapping of story ID to (story_text, user_input)
         models: List of small HuggingFace models to test for compression
         embedding_model: Model to use for embedding evaluation
         output_file: Optional file to save results (JSON)
+        batch_size: Embedding batch size
+        cache_dir: Directory for cached original-story embeddings (empty to disable)
+        generation_batch_size: Prompts generated together by each compression model
+        workers: Worker processes, one model at a time each (0 or 1 runs in this process)
 
     Returns:
         Dictionary with benchmark results
     """
-    results = []
-
-    # Initialize evaluator with local embedding model
-    evaluator = EmbeddingEvaluator(embedding_model)
-
-    print(f"Benchmarking {len(models)} HuggingFace models (<1B parameters) for story compression...")
-    print(f"Original story length: {len(story)} characters")
+    print(f"Benchmarking {len(models)} HuggingFace models (<1B parameters) on {len(stories)} stories...")
     print(f"Using embedding model: {embedding_model}")
 
-    for model_name in models:
-        print(f"\nTesting model: {model_name}")
-
-        try:
-            # Create compressor with this model
-            compressor = HuggingFaceCompressor(model_name)
-
-            # Time the compression
-            start_time = time.time()
-            compressed = compressor.compress(user_input, story)
-            compression_time = time.time() - start_time
-
-            # Evaluate compression
-            evaluation = evaluator.evaluate_compression(story, compressed)
-
-            # Add results
-            results.append(
-                {
-                    "model": model_name,
-                    "compression_time": compression_time,
-                    "evaluation": evaluation,
-                    "compressed_text": compressed[:300] + "..." if len(compressed) > 300 else compressed,
-                }
+    if workers > 1:
+        # a fresh process per model, so each one's peak RSS is its own and its memory is returned afterwards
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(workers, initializer=init_worker, initargs=(threads,), maxtasksperchild=1) as pool:
+            model_runs = pool.starmap(
+                compress_stories, [(model_name, stories, generation_batch_size) for model_name in models]
             )
+    else:
+        model_runs = [compress_stories(model_name, stories, generation_batch_size) for model_name in models]
 
-            # Print summary
-            print(f"  Compression ratio: {evaluation['compression_ratio']:.3f}")
-            print(f"  Semantic similarity: {evaluation['semantic_similarity']:.3f}")
-            print(f"  Quality score: {evaluation['quality_score']:.3f}")
-            print(f"  Time taken: {compression_time:.2f} seconds")
+    # Evaluate the whole matrix in one batch
+    evaluator, _ = evaluator_cache.get(
+        embedding_model, lambda: EmbeddingEvaluator(embedding_model, batch_size=batch_size, cache_dir=cache_dir)
+    )
+    cells = [
+        (run["model"], story_id, compression)
+        for run in model_runs
+        if "error" not in run
+        for story_id, compression in run["compressions"].items()
+    ]
+    evaluations = evaluator.evaluate_batch(
+        [(stories[story_id][0], compression["compressed_text"]) for _, story_id, compression in cells]
+    )
 
-        except Exception as e:
-            print(f"  Error testing model {model_name}: {e}")
-            results.append({"model": model_name, "error": str(e)})
+    results = []
+    for (model_name, story_id, compression), evaluation in zip(cells, evaluations):
+        compressed = compression["compressed_text"]
+        results.append(
+            {
+                "model": model_name,
+                "story_id": story_id,
+                "generated_tokens": compression["generated_tokens"],
+                "evaluation": evaluation,
+                "compressed_text": compressed[:300] + "..." if len(compressed) > 300 else compressed,
+            }
+        )
+
+    summaries = []
+    for run in model_runs:
+        summary = {key: value for key, value in run.items() if key != "compressions"}
+        scored = [result["evaluation"] for result in results if result["model"] == run["model"]]
+        for metric in ("compression_ratio", "semantic_similarity", "quality_score"):
+            if scored:
+                summary[f"mean_{metric}"] = float(np.mean([evaluation[metric] for evaluation in scored]))
+        summaries.append(summary)
+
+    # Print summary
+    print(f"\n{'Model':<40} {'ratio':>7} {'similarity':>11} {'quality':>8} {'tok/s':>8} {'peak RSS MiB':>13}")
+    for summary in summaries:
+        if "error" in summary:
+            print(f"{summary['model']:<40} error: {summary['error']}")
+            continue
+        print(
+            f"{summary['model']:<40} {summary['mean_compression_ratio']:>7.3f} "
+            f"{summary['mean_semantic_similarity']:>11.3f} {summary['mean_quality_score']:>8.3f} "
+            f"{summary['tokens_per_second']:>8.1f} {summary['peak_rss_bytes'] / 2**20:>13.0f}"
+        )
 
-    # Sort results by quality score (highest first)
-    valid_results = [r for r in results if "error" not in r]
-    if valid_results:
-        valid_results.sort(key=lambda x: x["evaluation"]["quality_score"], reverse=True)
-        best_model = valid_results[0]["model"]
-        print(f"\nBest performing model: {best_model}")
-        print(f"Quality score: {valid_results[0]['evaluation']['quality_score']:.3f}")
+    # Sort models by mean quality score (highest first)
+    valid_summaries = [s for s in summaries if "error" not in s]
+    if valid_summaries:
+        best = max(valid_summaries, key=lambda x: x["mean_quality_score"])
+        print(f"\nBest performing model: {best['model']}")
+        print(f"Quality score: {best['mean_quality_score']:.3f}")
 
     benchmark_results = {
-        "original_story_length": len(story),
+        "stories": {story_id: len(story) for story_id, (story, _) in stories.items()},
         "models_tested": len(models),
         "embedding_model": embedding_model,
+        "generation_batch_size": generation_batch_size,
+        "workers": workers,
+        # without a pool the process peak accumulates over the models run so far
+        "peak_rss_scope": "model" if workers > 1 else "process",
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "models": summaries,
         "results": results,
     }
 
@@ -367,7 +573,14 @@ def benchmark_huggingface_models(
     return benchmark_results
 
 
-def run_single_huggingface_test(model: str, story_id: str, output_dir: str = "test/compression/results"):
+def run_single_huggingface_test(
+    model: str,
+    story_id: str,
+    output_dir: str = "test/compression/results",
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+    batch_size: int = 32,
+    cache_dir: str = "test/compression/results/embeddings",
+):
     """
     Run a single compression test with a HuggingFace model and print results.
 
@@ -375,6 +588,9 @@ def run_single_huggingface_test(model: str, story_id: str, output_dir: str = "te
         model: HuggingFace model name to use for compression
         story_id: ID of the test story
         output_dir: Directory to save results
+        embedding_model: Model to use for embedding evaluation
+        batch_size: Embedding batch size
+        cache_dir: Directory for cached original-story embeddings (empty to disable)
     """
     story, user_input = StoryDataset.get_story(story_id)
 
@@ -382,9 +598,11 @@ def run_single_huggingface_test(model: str, story_id: str, output_dir: str = "te
     print(f"Story: {story_id}")
     print(f"Story length: {len(story)} characters")
 
-    # Create compressor and evaluator
-    compressor = HuggingFaceCompressor(model)
-    evaluator = EmbeddingEvaluator()
+    # Reuse loaded compressor and evaluator between calls
+    compressor, _ = compressor_cache.get(model, lambda: HuggingFaceCompressor(model))
+    evaluator, _ = evaluator_cache.get(
+        embedding_model, lambda: EmbeddingEvaluator(embedding_model, batch_size=batch_size, cache_dir=cache_dir)
+    )
 
     # Compress story
     start_time = time.time()
@@ -454,7 +672,8 @@ def main():
         "-s",
         type=str,
         default="village_baker",
-        help="Story ID to use (village_baker, time_traveler, family_winery, cave_adventure)",
+        help="Story ID to use (village_baker, time_traveler, family_winery, cave_adventure); "
+        "with --benchmark a comma-separated list or 'all'",
     )
     parser.add_argument("--benchmark", "-b", action="store_true", help="Run full benchmark with multiple models")
     parser.add_argument(
@@ -473,8 +692,24 @@ def main():
     parser.add_argument(
         "--output", "-o", type=str, default="test/compression/results", help="Directory to save results"
     )
+    parser.add_argument("--batch-size", type=int, default=32, help="Embedding batch size (default: 32)")
+    parser.add_argument(
+        "--embedding-cache",
+        type=str,
+        default=None,
+        help="Directory for cached original-story embeddings (default: <output>/embeddings, empty to disable)",
+    )
+    parser.add_argument(
+        "--generation-batch-size", type=int, default=4, help="Prompts generated together per model (default: 4)"
+    )
+    parser.add_argument(
+        "--workers", "-w", type=int, default=0, help="Worker processes for the benchmark, one model each (default: 0)"
+    )
+    parser.add_argument("--max-loaded-models", type=int, default=1, help="Compression models kept loaded (default: 1)")
 
     args = parser.parse_args()
+    compressor_cache.max_size = max(1, args.max_loaded_models)
+    cache_dir = os.path.join(args.output, "embeddings") if args.embedding_cache is None else args.embedding_cache
 
     # Create output directory if it doesn't exist
     os.makedirs(args.output, exist_ok=True)
@@ -482,21 +717,25 @@ def main():
     if args.benchmark:
         # Run benchmark with multiple models
         model_list = args.models.split(",")
-        story, user_input = StoryDataset.get_story(args.story)
+        story_ids = StoryDataset.story_ids if args.story == "all" else args.story.split(",")
+        stories = {story_id: StoryDataset.get_story(story_id) for story_id in story_ids}
 
         timestamp = time.strftime("%Y%m%d_%H%M%S")
-        output_file = f"{args.output}/benchmark_{args.story}_{timestamp}.json"
+        output_file = f"{args.output}/benchmark_{args.story.replace(',', '_')}_{timestamp}.json"
 
         benchmark_huggingface_models(
-            story=story,
-            user_input=user_input,
+            stories=stories,
             models=model_list,
             embedding_model=args.embedding,
             output_file=output_file,
+            batch_size=args.batch_size,
+            cache_dir=cache_dir,
+            generation_batch_size=args.generation_batch_size,
+            workers=args.workers,
         )
     else:
         # Run single test
-        run_single_huggingface_test(args.model, args.story, args.output)
+        run_single_huggingface_test(args.model, args.story, args.output, args.embedding, args.batch_size, cache_dir)
 
 
 if __name__ == "__main__":
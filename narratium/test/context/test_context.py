@@ -0,0 +1,61 @@
+import os
+import sys
+
+# Add repository root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from narratium.core.context import ContextBuilder
+from narratium.models.history import History, Story
+from narratium.utils import tokens
+from narratium.utils.tokens import count_tokens
+
+
+def make_history(path: str, turns: int) -> History:
+    """Build a history with a framework and the given number of turns, each with its compressed event."""
+    history = History("en", path, compact_every=1000)
+    history.add_story("story_framework", story="A river town.")
+    for turn in range(turns):
+        history.add_story("recent", story=f"The lock on door {turn} gives way. " * 10, user_input=f"open door {turn}")
+        history.add_story("history", story=f"Door {turn} was opened.")
+    return history
+
+
+def test_recent_turns_within_budget(tmp_path):
+    """The recent section keeps the newest turns that fit and leaves the rest to the history section."""
+    history = make_history(str(tmp_path / "history.json"), 6)
+    turn_tokens = history.recent_story.entry_tokens(5)
+    fixed = count_tokens("A river town.") + count_tokens("A locksmith.") + count_tokens("open door 6")
+    builder = ContextBuilder(budget=fixed + 3 * turn_tokens, k=0)
+
+    inputs, usage = builder.build(history, "A locksmith.", "open door 6")
+    assert usage["recent_turns"] == 3
+    assert usage["total"] <= usage["budget"]
+    assert inputs["recent_story"] == history.recent_story.get_story(3, 6)
+    assert builder.events_needed(history, "A locksmith.", "open door 6") == 3
+
+
+def test_last_turn_kept_over_budget(tmp_path):
+    """The last turn is kept even when the framework and character alone exceed the budget."""
+    history = make_history(str(tmp_path / "history.json"), 3)
+    builder = ContextBuilder(budget=1, k=0)
+
+    inputs, usage = builder.build(history, "A locksmith.", "open door 3")
+    assert usage["recent_turns"] == 1
+    assert inputs["recent_story"] == history.recent_story.entry(2)
+    assert inputs["history_story"] == ""
+    assert builder.events_needed(history, "A locksmith.", "open door 3") == 2
+
+
+def test_estimates_recounted_once_tokenizer_loads(monkeypatch):
+    """Counts cached while the tokenizer was loading are recounted with it once it is ready."""
+    monkeypatch.setattr(tokens, "encoding", None)
+    monkeypatch.setattr(tokens, "encoding_loader", object())
+    story = Story("en", ["look"], ["The hall is dark."])
+    estimate = story.entry_tokens(0)
+
+    class WordEncoding:
+        def encode(self, text, disallowed_special=()):
+            return text.split()
+
+    monkeypatch.setattr(tokens, "encoding", WordEncoding())
+    assert story.entry_tokens(0) == len(story.entry(0).split()) != estimate
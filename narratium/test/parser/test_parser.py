@@ -0,0 +1,77 @@
+import os
+import sys
+
+# Add repository root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from narratium.utils.parser import STORY_TAGS, StreamParser, parse_story
+
+STORY_OUTPUT = (
+    "Some preamble <with> stray < brackets.\n"
+    "<analysis>\nThe player opens the door.\n</analysis>\n"
+    "<narrative>\n  The door creaks open.\n\nA cold draft <slips> through the hall.  \n</narrative>\n"
+    "<next_prompts>\n- Step inside\n- Close the door\n</next_prompts>\n"
+)
+
+
+def stream(chunks: list, stream_tags: tuple = ("narrative",)) -> tuple:
+    """
+    Feed chunks to a story parser the way the streaming endpoints do.
+
+    Args:
+        chunks: Model output split into chunks
+        stream_tags: Sections streamed as deltas
+
+    Returns:
+        Tuple of (parse result, concatenated narrative deltas)
+    """
+    parser = StreamParser(STORY_TAGS, stream_tags=stream_tags)
+    deltas = []
+    for chunk in chunks:
+        deltas.extend(event.content for event in parser.feed(chunk) if event.kind == "delta")
+    return parser.close(), "".join(deltas)
+
+
+def test_every_two_chunk_split():
+    """Splitting the output anywhere, including inside a tag, gives the same result and deltas."""
+    expected = parse_story(STORY_OUTPUT)
+    for split in range(len(STORY_OUTPUT) + 1):
+        result, deltas = stream([STORY_OUTPUT[:split], STORY_OUTPUT[split:]])
+        assert result == expected, split
+        assert deltas == expected["narrative"], split
+
+
+def test_fixed_size_chunks():
+    """Chunks of every size, down to one character per chunk, give the same result and deltas."""
+    expected = parse_story(STORY_OUTPUT)
+    for size in range(1, len(STORY_OUTPUT) + 1):
+        chunks = [STORY_OUTPUT[start : start + size] for start in range(0, len(STORY_OUTPUT), size)]
+        result, deltas = stream(chunks)
+        assert result == expected, size
+        assert deltas == expected["narrative"], size
+
+
+def test_unterminated_stream_section_is_kept():
+    """A narrative cut off before its closing tag keeps the text that was already streamed."""
+    truncated = STORY_OUTPUT[: STORY_OUTPUT.index("hall.") + len("hall.")] + "  </narr"
+    for size in (1, 3, 7, len(truncated)):
+        chunks = [truncated[start : start + size] for start in range(0, len(truncated), size)]
+        result, deltas = stream(chunks)
+        assert result["narrative"] == deltas == "The door creaks open.\n\nA cold draft <slips> through the hall."
+        assert result["next_prompts"] == []
+
+
+def test_unterminated_section_without_streaming_is_dropped():
+    """Sections that are not streamed are only kept once closed, as with the whole-string parsers."""
+    truncated = STORY_OUTPUT[: STORY_OUTPUT.index("</narrative>")]
+    result, deltas = stream([truncated], stream_tags=())
+    assert result["narrative"] == ""
+    assert deltas == ""
+    assert parse_story(truncated)["narrative"] == ""
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
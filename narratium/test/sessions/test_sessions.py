@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+import sys
+
+# the stub model answers instantly; read when narratium.core.stub is first imported
+os.environ.setdefault("NARRATIUM_STUB_TOKENS_PER_SECOND", "0")
+os.environ.setdefault("NARRATIUM_STUB_FIRST_TOKEN_DELAY", "0")
+
+# Add repository root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from narratium.api.api import (
+    ActionRequest,
+    GameInitRequest,
+    NewGameRequest,
+    initialize_game,
+    sessions,
+    setup_new_game,
+    take_action,
+    take_action_stream,
+)
+from narratium.core.game import speculation_stats
+from narratium.core.sessions import SessionManager
+from narratium.models.history import History
+
+
+async def new_game() -> str:
+    """Initialize and set up a stub game through the API handlers, returning its game_id."""
+    response = await initialize_game(GameInitRequest(model="stub", type="stub"))
+    game_id = response.game_id
+    await setup_new_game(
+        NewGameRequest(game_id=game_id, story_framework="A river town.", character_info="A locksmith.")
+    )
+    return game_id
+
+
+def journal_seqs(game_id: str) -> list:
+    with open(f"history_{game_id}.json.journal", encoding="utf-8") as f:
+        return [json.loads(line)["seq"] for line in f]
+
+
+async def eviction_during_stream():
+    max_sessions = sessions.max_sessions
+    try:
+        game_a = await new_game()
+        game_b = await new_game()
+        sessions.max_sessions = 1
+
+        # the stream's response is returned before its turn starts; a turn of another game evicts A in that gap
+        response = await take_action_stream(ActionRequest(game_id=game_a, user_input="Open the door"))
+        await take_action(ActionRequest(game_id=game_b, user_input="Look around"))
+        assert game_a not in sessions.sessions
+
+        events = [json.loads(line) async for line in response.body_iterator]
+        assert events[-1]["type"] == "complete", events[-1]
+        await take_action(ActionRequest(game_id=game_a, user_input="Step inside"))
+    finally:
+        await sessions.close_all()
+        sessions.max_sessions = max_sessions
+
+    seqs = journal_seqs(game_a)
+    assert len(seqs) == len(set(seqs)), seqs
+
+    history = History("en", f"history_{game_a}.json")
+    assert history.load_history()
+    # the setup turn and two actions, each with its compressed event
+    assert len(history.recent_story.story) == 3
+    assert len(history.history_story.story) == 3
+
+
+def test_eviction_during_stream(tmp_path, monkeypatch):
+    """A session evicted between a stream's response and its turn is rehydrated, not written by two copies."""
+    monkeypatch.chdir(tmp_path)
+    asyncio.run(eviction_during_stream())
+
+
+async def close_during_speculation():
+    game_id = await new_game()
+    game = await sessions.get(game_id)
+    game.speculative_k = 2
+    try:
+        started = speculation_stats["started"]
+        await game.atake_action("Open the door")
+        # speculation is still waiting for this turn's compression when the session closes
+        assert game.speculating is not None and not game.speculating.done()
+        await game.aclose()
+        await asyncio.sleep(0.05)
+        assert game.speculations == {}
+        assert speculation_stats["started"] == started
+    finally:
+        await sessions.close_all()
+
+
+def test_close_cancels_speculation(tmp_path, monkeypatch):
+    """Closing a session cancels a pending speculation before it starts any LLM calls."""
+    monkeypatch.chdir(tmp_path)
+    asyncio.run(close_during_speculation())
+
+
+class FakeGame:
+    """A session without a model or history, enough for the manager's bookkeeping."""
+
+    history = None
+
+    def __init__(self, game_id: str, **config):
+        self.game_id = game_id
+        self.config = config
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def fake_manager(stored: dict, built: list, **kwargs) -> SessionManager:
+    def create_game(game_id, **config):
+        built.append(game_id)
+        return FakeGame(game_id, **config)
+
+    return SessionManager(create_game, load_config=stored.get, **kwargs)
+
+
+async def rehydration():
+    built = []
+    manager = fake_manager({"a": {"model": "stored"}}, built, max_sessions=1, max_configs=1)
+    manager.add("a", FakeGame("a"), model="live")
+    manager.add("b", FakeGame("b"), model="live")
+    await asyncio.sleep(0)
+    assert list(manager.sessions) == ["b"]
+    # only the newest config is kept; a's comes back from its stored history
+    assert list(manager.configs) == ["b"]
+
+    game = await manager.get("a")
+    assert game.config == {"model": "stored"}
+    assert manager.rehydrated == 1
+
+    # ids with no stored history are never built
+    assert await manager.get("missing") is None
+    assert built == ["a"]
+    await manager.close_all()
+
+
+def test_rehydration():
+    """Evicted sessions are rebuilt from their stored config; unknown ids are not built at all."""
+    asyncio.run(rehydration())
+
+
+async def coalesced_turn_hold():
+    manager = fake_manager({}, [], max_sessions=1, turn_policy="coalesce")
+    manager.add("a", FakeGame("a"))
+    started = asyncio.Event()
+
+    async def turn(game):
+        started.set()
+        return game.game_id
+
+    pending = asyncio.ensure_future(manager.run_turn("a", "key", turn))
+    await asyncio.sleep(0)
+    # the turn is scheduled but has not run yet; a new session must not evict it
+    assert not started.is_set()
+    manager.add("b", FakeGame("b"))
+    assert "a" in manager.sessions
+    assert await pending == "a"
+    assert manager.holds == {}
+    await manager.close_all()
+
+
+def test_coalesced_turn_hold():
+    """A coalesced turn holds its session from the moment it is scheduled."""
+    asyncio.run(coalesced_turn_hold())
+
+
+async def eviction_order():
+    manager = fake_manager({}, [], max_sessions=2)
+    games = {game_id: FakeGame(game_id) for game_id in "abcd"}
+    manager.add("a", games["a"])
+    manager.add("b", games["b"])
+    # using a makes b the least recently used
+    await manager.get("a")
+    manager.add("c", games["c"])
+    assert list(manager.sessions) == ["a", "c"]
+
+    # a session held by a turn is skipped and the next least recently used one goes instead
+    with manager.hold("a"):
+        manager.add("d", games["d"])
+    assert list(manager.sessions) == ["a", "d"]
+    await asyncio.sleep(0)
+    assert games["b"].closed and games["c"].closed and not games["a"].closed
+    assert manager.stats()["evicted"] == 2
+    await manager.close_all()
+
+
+def test_eviction_order():
+    """Sessions over the limit are evicted least recently used first, skipping held ones, and closed."""
+    asyncio.run(eviction_order())
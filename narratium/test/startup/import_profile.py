@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# heavy dependencies that must only load when a session or script actually needs them
+FORBIDDEN_MODULES = "langchain_openai,langchain_ollama,openai,ollama,torch,transformers,sentence_transformers"
+
+
+def import_once(module: str) -> tuple[float, list]:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Args:
+        module: Dotted name of the module to import
+
+    Returns:
+        Wall-clock import time in seconds and the parsed importtime entries
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return float(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def parse_importtime(output: str) -> list:
+    """
+    Parse -X importtime lines into entries with self/cumulative microseconds and the importing module.
+
+    importtime prints children before their parent, one indentation level deeper.
+    """
+    entries = []
+    pending = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        head, cumulative_us, name = line.split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        entry = {"name": name.strip(), "self": int(head.split(":")[1]), "cumulative": int(cumulative_us)}
+        for child in pending.pop(depth + 1, []):
+            child["parent"] = entry["name"]
+        pending.setdefault(depth, []).append(entry)
+        entries.append(entry)
+    return entries
+
+
+def profile(module: str, repeat: int) -> dict:
+    runs = [import_once(module) for _ in range(repeat)]
+    wall = [elapsed for elapsed, _ in runs]
+    # the run with the median wall time stands for the breakdown
+    _, entries = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+
+    narratium = {}
+    dependencies = {}
+    for entry in entries:
+        if entry["name"].startswith("narratium"):
+            narratium[entry["name"]] = {"self_ms": entry["self"] / 1000, "cumulative_ms": entry["cumulative"] / 1000}
+        elif entry.get("parent", "").startswith("narratium"):
+            # third-party packages charged to the Narratium module that imported them first
+            dependencies[entry["name"]] = {"imported_by": entry["parent"], "cumulative_ms": entry["cumulative"] / 1000}
+
+    return {
+        "module": module,
+        "repeat": repeat,
+        "wall_ms": {"median": statistics.median(wall) * 1000, "min": min(wall) * 1000, "max": max(wall) * 1000},
+        "imported": sorted({entry["name"] for entry in entries}),
+        "narratium": dict(sorted(narratium.items(), key=lambda item: -item[1]["cumulative_ms"])),
+        "dependencies": dict(sorted(dependencies.items(), key=lambda item: -item[1]["cumulative_ms"])),
+    }
+
+
+def check_budget(report: dict, budget_ms: float, forbidden: list) -> list:
+    failures = []
+    if budget_ms and report["wall_ms"]["median"] > budget_ms:
+        failures.append(
+            f"import of {report['module']} took {report['wall_ms']['median']:.0f}ms (budget {budget_ms:.0f}ms)"
+        )
+    imported = set(report["imported"])
+    for module in forbidden:
+        if module in imported:
+            failures.append(f"{module} is imported at startup")
+    return failures
+
+
+def print_report(report: dict, limit: int):
+    wall = report["wall_ms"]
+    print(f"\nimport {report['module']}: median {wall['median']:.0f}ms (min {wall['min']:.0f}, max {wall['max']:.0f})")
+    print(f"\n{'Narratium module':<40} {'self ms':>9} {'cumulative ms':>14}")
+    for name, times in report["narratium"].items():
+        print(f"{name:<40} {times['self_ms']:>9.1f} {times['cumulative_ms']:>14.1f}")
+    print(f"\n{'Dependency':<40} {'imported by':<28} {'cumulative ms':>14}")
+    for name, dependency in list(report["dependencies"].items())[:limit]:
+        print(f"{name:<40} {dependency['imported_by']:<28} {dependency['cumulative_ms']:>14.1f}")
+
+
+def main():
+    """Parse command line arguments, profile the import and enforce the startup budget"""
+    parser = argparse.ArgumentParser(description="Import-time profile and startup budget check")
+    parser.add_argument("--module", type=str, default="narratium.api.api", help="Module to import")
+    parser.add_argument("--repeat", "-r", type=int, default=5, help="Fresh interpreters to time (median is used)")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.getenv("NARRATIUM_STARTUP_BUDGET_MS", "1000")),
+        help="Fail when the median import takes longer (0 disables, default: NARRATIUM_STARTUP_BUDGET_MS or 1000)",
+    )
+    parser.add_argument(
+        "--forbid", type=str, default=FORBIDDEN_MODULES, help="Comma-separated modules that must not load at startup"
+    )
+    parser.add_argument("--limit", type=int, default=15, help="Dependencies to list")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Optional file to save the report (JSON)")
+
+    args = parser.parse_args()
+    report = profile(args.module, max(1, args.repeat))
+    print_report(report, args.limit)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = check_budget(report, args.budget_ms, [name for name in args.forbid.split(",") if name])
+    for failure in failures:
+        print(f"Error: {failure}")
+    if failures:
+        sys.exit(1)
+    print("\nStartup budget ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import sys
+
+# Add repository root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from narratium.db.store import SQLiteStore
+from narratium.models.history import History
+
+
+def write_game(path: str, turns: int) -> History:
+    """Write a journaled history with a framework and the given number of recent turns."""
+    history = History("en", path, compact_every=1000)
+    history.add_story("story_framework", story="A river town.")
+    for turn in range(turns):
+        history.add_story("recent", story=f"Turn {turn}.", user_input=f"action {turn}")
+    history.save_history()
+    return history
+
+
+def reload(path: str) -> History:
+    history = History("en", path, compact_every=1000)
+    assert history.load_history()
+    return history
+
+
+def test_replay_after_compaction(tmp_path):
+    """Records appended after a compaction replay on top of the snapshot."""
+    path = str(tmp_path / "history_replay.json")
+    history = write_game(path, 3)
+    history.compact()
+    history.add_story("recent", story="Turn 3.", user_input="action 3")
+    history.save_history()
+
+    loaded = reload(path)
+    assert loaded.recent_story.story == [f"Turn {turn}." for turn in range(4)]
+    assert loaded.seq == history.seq
+
+
+def test_torn_last_line(tmp_path):
+    """A partial last line is dropped, the journal is folded into a snapshot and later appends survive."""
+    path = str(tmp_path / "history_torn.json")
+    write_game(path, 2)
+    with open(path + ".journal", "a", encoding="utf-8") as f:
+        f.write('{"seq": 4, "type": "recent", "story": "Tur')
+
+    loaded = reload(path)
+    assert loaded.recent_story.story == ["Turn 0.", "Turn 1."]
+    assert os.path.getsize(path + ".journal") == 0
+
+    loaded.add_story("recent", story="Turn 2.", user_input="action 2")
+    loaded.save_history()
+    assert reload(path).recent_story.story == ["Turn 0.", "Turn 1.", "Turn 2."]
+
+
+def test_corrupt_middle_line(tmp_path):
+    """A corrupt line in the middle is skipped and the valid records after it still replay."""
+    path = str(tmp_path / "history_corrupt.json")
+    write_game(path, 3)
+    with open(path + ".journal", encoding="utf-8") as f:
+        lines = f.readlines()
+    lines[2] = "{not json\n"
+    with open(path + ".journal", "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+    loaded = reload(path)
+    # the corrupt line held turn 1; turns 0 and 2 survive, and compaction keeps them
+    assert loaded.recent_story.story == ["Turn 0.", "Turn 2."]
+    assert os.path.getsize(path + ".journal") == 0
+    assert reload(path).recent_story.story == ["Turn 0.", "Turn 2."]
+
+
+def test_duplicate_records_are_skipped(tmp_path):
+    """Records already folded into the snapshot are skipped by seq on replay."""
+    path = str(tmp_path / "history_duplicate.json")
+    history = write_game(path, 2)
+    with open(path + ".journal", encoding="utf-8") as f:
+        records = f.read()
+    history.compact()
+    # a crash between the snapshot rename and the journal truncation leaves the old records behind
+    with open(path + ".journal", "w", encoding="utf-8") as f:
+        f.write(records)
+
+    loaded = reload(path)
+    assert loaded.recent_story.story == ["Turn 0.", "Turn 1."]
+    assert [json.loads(line)["seq"] for line in records.splitlines()] == [1, 2, 3]
+
+
+def test_sqlite_replay_and_old_column(tmp_path):
+    """Tables with the old turn_no column are renamed to seq and their rows replay."""
+    db = str(tmp_path / "narratium.db")
+    connection = sqlite3.connect(db)
+    connection.execute(
+        "CREATE TABLE game_turns (session_id VARCHAR NOT NULL, turn_no INTEGER NOT NULL, kind VARCHAR NOT NULL, "
+        "user_input TEXT, text TEXT NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, "
+        "PRIMARY KEY (session_id, turn_no)) WITHOUT ROWID"
+    )
+    connection.execute("INSERT INTO game_turns VALUES ('old', 1, 'story_framework', NULL, 'A river town.', NULL)")
+    connection.commit()
+    connection.close()
+
+    path = str(tmp_path / "history_old.json")
+    history = History("en", path, session_id="old", store=SQLiteStore("old", db))
+    assert history.load_history()
+    history.add_story("recent", story="Turn 0.", user_input="action 0")
+    history.save_history()
+
+    loaded = History("en", path, session_id="old", store=SQLiteStore("old", db))
+    assert loaded.load_history()
+    assert loaded.get_story("story_framework") == "A river town."
+    assert loaded.recent_story.story == ["Turn 0."]
+    columns = [row[1] for row in sqlite3.connect(db).execute("PRAGMA table_info(game_turns)")]
+    assert columns[:2] == ["session_id", "seq"]
@@ -1,83 +1,150 @@
-def parse_story(story: str):
-    result = {"analysis": "", "narrative": "", "next_prompts": []}
-    analysis_start = story.find("<analysis>")
-    analysis_end = story.find("</analysis>")
-    if analysis_start != -1 and analysis_end != -1:
-        result["analysis"] = story[analysis_start + 10 : analysis_end].strip()
-
-    narrative_start = story.find("<narrative>")
-    narrative_end = story.find("</narrative>")
-    if narrative_start != -1 and narrative_end != -1:
-        result["narrative"] = story[narrative_start + 11 : narrative_end].strip()
+from typing import NamedTuple
+
+STORY_TAGS = ("analysis", "narrative", "next_prompts")
+EVENT_TAGS = ("event",)
+CHARACTER_TAGS = ("name", "description", "personality", "background", "appearance", "skills", "location", "status")
+
+
+class ParseEvent(NamedTuple):
+    # kind is "delta" for streamed text of a section, "section" once a section is closed,
+    # and "complete" with the full parse result at the end of a game stream
+    kind: str
+    tag: str
+    content: str | list[str] | dict
+
+
+def parse_prompts(text: str) -> list[str]:
+    prompts = [p.strip("- ").strip() for p in text.strip().split("\n")]
+    return [p for p in prompts if p]
+
+
+class StreamParser:
+    def __init__(self, tags: tuple[str, ...], stream_tags: tuple[str, ...] = ()):
+        self.tags = set(tags)
+        self.stream_tags = set(stream_tags)
+        self.max_tag_len = max(len(tag) for tag in tags)
+        self.results = {tag: [] if tag == "next_prompts" else "" for tag in tags}
+        self.completed = set()
+        self.carry = ""
+        self.tag = None
+        self.close_tag = ""
+        self.parts = []
+        self.started = False
+        self.pending = ""
+
+    def feed(self, chunk: str) -> list[ParseEvent]:
+        events = []
+        data = self.carry + chunk
+        self.carry = ""
+        pos = 0
+        end = len(data)
+
+        while pos < end:
+            if self.tag is None:
+                lt = data.find("<", pos)
+                if lt == -1:
+                    break
+                gt = data.find(">", lt + 1, lt + self.max_tag_len + 2)
+                if gt == -1:
+                    if end - lt < self.max_tag_len + 2:
+                        # an opening tag may be split across chunks
+                        self.carry = data[lt:]
+                        break
+                    pos = lt + 1
+                    continue
+                name = data[lt + 1 : gt]
+                if name in self.tags and name not in self.completed:
+                    self.open_section(name)
+                    pos = gt + 1
+                else:
+                    pos = lt + 1
+            else:
+                close_at = data.find(self.close_tag, pos)
+                if close_at == -1:
+                    keep = self.partial_close_len(data, pos)
+                    self.append(data[pos : end - keep], events)
+                    self.carry = data[end - keep :]
+                    break
+                self.append(data[pos:close_at], events)
+                self.close_section(events)
+                pos = close_at + len(self.close_tag)
+
+        return events
+
+    def close(self) -> dict:
+        # unterminated sections are dropped, as with the whole-string parsers, except streamed ones: their text
+        # already reached the client, e.g. a narrative cut off by max_tokens, so it is kept as streamed
+        if self.tag in self.stream_tags:
+            text = "".join(self.parts)
+            self.results[self.tag] = parse_prompts(text) if self.tag == "next_prompts" else text.strip()
+        self.carry = ""
+        self.tag = None
+        self.parts = []
+        return self.results
+
+    def parse(self, text: str) -> dict:
+        self.feed(text)
+        return self.close()
+
+    def open_section(self, name: str):
+        self.tag = name
+        self.close_tag = f"</{name}>"
+        self.parts = []
+        self.started = False
+        self.pending = ""
+
+    def close_section(self, events: list[ParseEvent]):
+        tag = self.tag
+        # trailing whitespace held back by append() is dropped, matching strip()
+        self.pending = ""
+        text = "".join(self.parts)
+        content = parse_prompts(text) if tag == "next_prompts" else text.strip()
+        self.results[tag] = content
+        self.completed.add(tag)
+        self.tag = None
+        self.parts = []
+        events.append(ParseEvent("section", tag, content))
+
+    def append(self, text: str, events: list[ParseEvent]):
+        if not text:
+            return
+        self.parts.append(text)
+        if self.tag not in self.stream_tags:
+            return
+
+        text = self.pending + text
+        if not self.started:
+            text = text.lstrip()
+            if not text:
+                self.pending = ""
+                return
+            self.started = True
+        delta = text.rstrip()
+        self.pending = text[len(delta) :]
+        if delta:
+            events.append(ParseEvent("delta", self.tag, delta))
+
+    def partial_close_len(self, data: str, pos: int) -> int:
+        start = max(pos, len(data) - len(self.close_tag) + 1)
+        lt = data.find("<", start)
+        while lt != -1:
+            if self.close_tag.startswith(data[lt:]):
+                return len(data) - lt
+            lt = data.find("<", lt + 1)
+        return 0
 
-    prompts_start = story.find("<next_prompts>")
-    prompts_end = story.find("</next_prompts>")
-    if prompts_start != -1 and prompts_end != -1:
-        prompts_text = story[prompts_start + 14 : prompts_end]
-        prompts = [p.strip("- ").strip() for p in prompts_text.strip().split("\n")]
-        result["next_prompts"] = [p for p in prompts if p]
 
-    return result
+def parse_story(story: str):
+    return StreamParser(STORY_TAGS).parse(story)
 
 
 def parse_event(story: str):
-    event_start = story.find("<event>")
-    event_end = story.find("</event>")
-    if event_start != -1 and event_end != -1:
-        return story[event_start + 7 : event_end].strip()
+    parser = StreamParser(EVENT_TAGS)
+    parser.parse(story)
+    if "event" in parser.completed:
+        return parser.results["event"]
     return story
 
 
 def parse_character(story: str):
-    result = {
-        "name": "",
-        "description": "",
-        "personality": "",
-        "background": "",
-        "appearance": "",
-        "skills": "",
-        "location": "",
-        "status": "",
-    }
-
-    name_start = story.find("<name>")
-    name_end = story.find("</name>")
-    if name_start != -1 and name_end != -1:
-        result["name"] = story[name_start + 6 : name_end].strip()
-
-    description_start = story.find("<description>")
-    description_end = story.find("</description>")
-    if description_start != -1 and description_end != -1:
-        result["description"] = story[description_start + 13 : description_end].strip()
-
-    personality_start = story.find("<personality>")
-    personality_end = story.find("</personality>")
-    if personality_start != -1 and personality_end != -1:
-        result["personality"] = story[personality_start + 14 : personality_end].strip()
-
-    background_start = story.find("<background>")
-    background_end = story.find("</background>")
-    if background_start != -1 and background_end != -1:
-        result["background"] = story[background_start + 12 : background_end].strip()
-
-    appearance_start = story.find("<appearance>")
-    appearance_end = story.find("</appearance>")
-    if appearance_start != -1 and appearance_end != -1:
-        result["appearance"] = story[appearance_start + 12 : appearance_end].strip()
-
-    skills_start = story.find("<skills>")
-    skills_end = story.find("</skills>")
-    if skills_start != -1 and skills_end != -1:
-        result["skills"] = story[skills_start + 8 : skills_end].strip()
-
-    location_start = story.find("<location>")
-    location_end = story.find("</location>")
-    if location_start != -1 and location_end != -1:
-        result["location"] = story[location_start + 10 : location_end].strip()
-
-    status_start = story.find("<status>")
-    status_end = story.find("</status>")
-    if status_start != -1 and status_end != -1:
-        result["status"] = story[status_start + 8 : status_end].strip()
-
-    return result
+    return StreamParser(CHARACTER_TAGS).parse(story)
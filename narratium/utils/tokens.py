@@ -0,0 +1,64 @@
+import os
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+tokenizer_encoding = os.getenv("NARRATIUM_TOKENIZER", "cl100k_base")
+tokenizer_timeout = float(os.getenv("NARRATIUM_TOKENIZER_TIMEOUT", "5"))
+
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+encoding = None
+encoding_loader = None
+encoding_lock = threading.Lock()
+
+
+def load_encoding():
+    global encoding
+    try:
+        encoding = tiktoken.get_encoding(tokenizer_encoding)
+    except Exception as e:
+        print(f"Error loading tokenizer {tokenizer_encoding}, falling back to estimates: {str(e)}")
+
+
+def warm_encoding(timeout: float = tokenizer_timeout):
+    # tiktoken downloads an encoding missing from its cache with no timeout, so it never loads on the caller's thread
+    global encoding_loader
+    if tiktoken is None:
+        return None
+    with encoding_lock:
+        if encoding_loader is None:
+            encoding_loader = threading.Thread(target=load_encoding, name="tokenizer", daemon=True)
+            encoding_loader.start()
+    if timeout > 0:
+        encoding_loader.join(timeout)
+        if encoding_loader.is_alive():
+            print(f"Tokenizer {tokenizer_encoding} not loaded after {timeout}s, using estimates until it is")
+    return encoding
+
+
+def get_encoding():
+    # counts are estimated until the encoding has loaded
+    if encoding is None and encoding_loader is None:
+        warm_encoding(0)
+    return encoding
+
+
+def exact_counts() -> bool:
+    # False while counts are estimates; counts cached before the encoding loaded are recounted once this turns True
+    return encoding is not None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = get_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # without a tokenizer: one token per CJK character, roughly four characters per token otherwise
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4